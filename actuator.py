@@ -1,4 +1,5 @@
 import utils
+import instrumentation
 from typing import Dict
 from enum import Enum
 import numpy as np
@@ -7,11 +8,14 @@ from abc import ABC, abstractmethod
 
 class Actuator(ABC):
     def __init__(self, constraints: Dict[str, float]):
-        self.constraints = constraints
+        self.constraints = dict(constraints)
 
     @abstractmethod
-    def actuate(self, vector: np.array, delta_commands: np.array,
-              father_joint_sys: np.array, child_joint_sys: np.array):    
+    def actuate(self, command: np.array) -> None:
+        pass
+
+    @abstractmethod
+    def rotation(self, rest_basis: np.array) -> np.array:
         pass
 
 class RotaryActuator(Actuator):
@@ -19,31 +23,35 @@ class RotaryActuator(Actuator):
         super(RotaryActuator, self).__init__(constraints=constraints)
         self.id = id    
         self.angle = start_angle
+        self.start_angle = start_angle
         self.axis = axis
         if self.constraints['max'] != np.inf:
             self.constraints['max'] *= np.pi/180
         if self.constraints['min'] != -np.inf:
             self.constraints['min'] *= np.pi/180
 
-    def actuate(self, child_config: Dict[str, np.array], parent_config: Dict[str, np.array], command: np.array) -> None:                        
-        self.angle += command[self.axis]   
-        temp_angle = min(self.constraints['max'], self.angle)
-        temp_angle = max(self.constraints['min'], temp_angle)         
-        command[self.axis] += temp_angle - self.angle 
-
-        if child_config["id"] == parent_config["id"]:
-            self.angle = temp_angle
-        else:
-            self.angle -= command[self.axis] - (temp_angle - self.angle) 
-
-
-        q = utils.axisangle_to_q(v=parent_config["basis"][self.axis,:], theta=command[self.axis])
-
-        # update child joint system
-        for i in range(3):
-            child_config["basis"][i, :] = utils.qv_mult(q, child_config["basis"][i, :])
-
-        child_config["coords"][:] = utils.qv_mult(q, child_config["coords"] - parent_config["coords"]) + parent_config["coords"]
+    def actuate(self, command: np.array) -> None:
+        """
+            Update the actuator angle.
+
+            command: np.array - joint command, the angular delta is clipped to the constraints in place
+        """
+        temp_angle = min(self.constraints['max'], self.angle + command[self.axis])
+        temp_angle = max(self.constraints['min'], temp_angle)
+        instrumentation.count("actuator_calls")
+        if temp_angle != self.angle + command[self.axis]:
+            instrumentation.count("clamps")
+        command[self.axis] = temp_angle - self.angle
+        self.angle = temp_angle
+
+    def rotation(self, rest_basis: np.array) -> np.array:
+        """
+            Rotation of the joint system with respect to its rest state (same convention of utils.qv_mult)
+
+            rest_basis: np.array -> shape = (3, 3), joint basis in the rest state
+        """
+        q = utils.axisangle_to_q(v=rest_basis[self.axis, :], theta=self.angle - self.start_angle)
+        return utils.q_to_matrix(q)
 
 
 class ActuatorSelector(Enum):
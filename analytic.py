@@ -0,0 +1,175 @@
+from __future__ import annotations
+import numpy as np
+from typing import List, Optional, TYPE_CHECKING
+if TYPE_CHECKING:
+    from skeleton import Skeleton
+
+
+def _rotate(v: np.array, axis: np.array, angle: float) -> np.array:
+    """
+        Right handed rotation of v around the unit axis (Rodrigues formula)
+    """
+    return v*np.cos(angle) + np.cross(axis, v)*np.sin(angle) + axis*(axis @ v)*(1 - np.cos(angle))
+
+
+class PlanarChain:
+    # number of orientations of the last link tried by 3R chains (redundant, one free parameter)
+    N_ORIENTATIONS = 16
+
+    def __init__(self, skeleton: Skeleton, effector: int, yaw: Optional[int], planar: List[int]) -> None:
+        """
+            Closed form Inverse kinematics of a chain made of an optional base joint (yaw) followed by 1 to 3
+            joints rotating around parallel axes (planar 1R, 2R, 3R), with the chain lying in a plane that
+            contains the yaw axis. Use detect to build it.
+
+            effector: int - joint reaching the target
+            yaw: int - joint rotating the plane of the chain, None if the chain has no base joint
+            planar: List[int] - joints rotating inside the plane, from the root to the effector
+        """
+        self.skeleton = skeleton
+        self.effector = effector
+        self.yaw = yaw
+        self.planar = planar
+        self.axes_index = [skeleton.joints[j].actuators[0].axis for j in planar]
+        axes = [skeleton.rest_bases[j, a] for j, a in zip(planar, self.axes_index)]
+        self.normal = axes[0]
+        # actuators rotating around -normal turn the plane the other way
+        self.signs = np.array([np.sign(a @ self.normal) for a in axes])
+        self.origin = skeleton.rest_locations[planar[0]]
+        # actuators set by the closed form
+        self.mask = np.zeros(shape=(len(skeleton.joints), 3), dtype=bool)
+        self.mask[planar, self.axes_index] = True
+        if yaw is not None:
+            self.yaw_axis_index = skeleton.joints[yaw].actuators[0].axis
+            self.yaw_axis = skeleton.rest_bases[yaw, self.yaw_axis_index]
+            self.mask[yaw, self.yaw_axis_index] = True
+            self.e_z = self.yaw_axis
+        else:
+            links = [skeleton.rest_locations[j] - self.origin for j in planar[1:] + [effector]]
+            link = next((l for l in links if np.linalg.norm(l) > 0), np.cross(self.normal, [1., 0, 0]))
+            self.e_z = link/np.linalg.norm(link)
+        # 2d frame of the plane, counterclockwise angles are right handed rotations around normal
+        self.e_r = np.cross(self.e_z, self.normal)
+        points = np.array([self.to_plane(skeleton.rest_locations[j]) for j in planar + [effector]])
+        links = np.diff(points, axis=0)
+        self.lengths = np.linalg.norm(links, axis=1)
+        self.rest_directions = np.arctan2(links[:, 1], links[:, 0])
+
+    @classmethod
+    def detect(cls, skeleton: Skeleton, joints_id: List[int], rtol: float = 1e-9) -> Optional[PlanarChain]:
+        """
+            PlanarChain reaching joints_id if the chain from the root admits the closed form, None otherwise
+        """
+        if len(joints_id) != 1:
+            return None
+        effector = joints_id[0]
+        chain = skeleton.topology.chain(effector)
+        actuated = [j for j in chain[:-1].tolist() if skeleton.actuated_axes[j].any()]
+        if len(actuated) == 0 or any(np.count_nonzero(skeleton.actuated_axes[j]) != 1 for j in actuated):
+            return None
+        if any(len(skeleton.joints[j].actuators) != 1 for j in actuated):
+            return None
+        scale = max(np.max(np.abs(skeleton.rest_locations[chain])), 1.0)
+
+        def axis(j: int) -> np.array:
+            return skeleton.rest_bases[j, skeleton.joints[j].actuators[0].axis]
+
+        for yaw, planar in ((actuated[0], actuated[1:]), (None, actuated)):
+            if not 1 <= len(planar) <= 3:
+                continue
+            normal = axis(planar[0])
+            if any(abs(abs(axis(j) @ normal) - 1) > rtol for j in planar):
+                continue
+            # joints moved by the planar joints must stay in their plane
+            start = int(np.flatnonzero(chain == planar[0])[0])
+            points = skeleton.rest_locations[chain[start:]]
+            if np.any(np.abs((points - points[0]) @ normal) > rtol*scale):
+                continue
+            if yaw is not None:
+                yaw_axis = axis(yaw)
+                # the yaw axis must lie in the plane, the yaw then rotates the whole plane
+                if abs(yaw_axis @ normal) > rtol or \
+                   abs((skeleton.rest_locations[yaw] - points[0]) @ normal) > rtol*scale:
+                    continue
+            return cls(skeleton=skeleton, effector=effector, yaw=yaw, planar=planar)
+        return None
+
+    def to_plane(self, point: np.array) -> np.array:
+        offset = point - self.origin
+        return np.array([offset @ self.e_r, offset @ self.e_z])
+
+    def __planar_solutions(self, target: np.array, current: np.array) -> np.array:
+        """
+            Absolute directions of the links reaching target (2d), targets out of reach give the closest pose
+
+            current: np.array -> shape = (n_links,), current absolute directions of the links
+            return np.array -> shape = (n_solutions, n_links)
+        """
+        n_links = len(self.planar)
+        if n_links == 1:
+            return np.array([[np.arctan2(target[1], target[0])]])
+        if n_links == 3:
+            # the last link orientation is free: aim at the target, keep the current one, or sample it
+            last = np.concatenate(([np.arctan2(target[1], target[0]), current[2]],
+                                   np.linspace(-np.pi, np.pi, self.N_ORIENTATIONS, endpoint=False)))
+            wrists = target - self.lengths[2]*np.stack((np.cos(last), np.sin(last)), axis=1)
+        else:
+            last = np.zeros(shape=(1,))
+            wrists = target[None]
+        l1, l2 = self.lengths[0], self.lengths[1]
+        dist2 = np.sum(wrists**2, axis=1)
+        cos_elbow = np.clip((dist2 - l1**2 - l2**2)/(2*l1*l2), -1, 1) if l1*l2 > 0 else np.ones_like(dist2)
+        solutions = []
+        for elbow in (np.arccos(cos_elbow), -np.arccos(cos_elbow)):
+            first = np.arctan2(wrists[:, 1], wrists[:, 0]) - np.arctan2(l2*np.sin(elbow), l1 + l2*np.cos(elbow))
+            directions = [first, first + elbow] + ([last] if n_links == 3 else [])
+            solutions.append(np.stack(directions, axis=1))
+        return np.concatenate(solutions)
+
+    def candidates(self, target: np.array, angles: np.array) -> np.array:
+        """
+            Poses reaching target (or its closest reachable point), clipped to the actuators constraints:
+            a clipped pose misses target but still seeds the iterations next to it.
+            Joints out of the chain keep their angles.
+
+            target: np.array -> shape = (3,)
+            angles: np.array -> shape = (n_joints, 3), current actuators angles
+            return np.array -> shape = (n_candidates, n_joints, 3)
+        """
+        skeleton = self.skeleton
+        delta = skeleton.rest_angles - angles
+        axes = self.axes_index
+        # current absolute link directions, an actuator angle theta turns the plane by -sign*theta
+        current = self.rest_directions + np.cumsum([s*delta[j, a] for j, a, s in zip(self.planar, axes, self.signs)])
+
+        yaws = [None]
+        if self.yaw is not None:
+            offset = target - skeleton.rest_locations[self.yaw]
+            horizontal = offset - (offset @ self.yaw_axis)*self.yaw_axis
+            if np.linalg.norm(horizontal) > 1e-12:
+                heading = np.arctan2(np.cross(self.e_r, horizontal) @ self.yaw_axis, self.e_r @ horizontal)
+                # the plane can face the target or turn its back to it
+                yaws = [heading, heading + np.pi]
+            else:
+                yaws = [skeleton.rest_angles[self.yaw, self.yaw_axis_index] - angles[self.yaw, self.yaw_axis_index]]
+
+        candidates = []
+        for yaw in yaws:
+            pose = angles.copy()
+            plane_target = target
+            if yaw is not None:
+                pose[self.yaw, self.yaw_axis_index] = skeleton.rest_angles[self.yaw, self.yaw_axis_index] - yaw
+                # target expressed in the rest plane
+                base = skeleton.rest_locations[self.yaw]
+                plane_target = base + _rotate(v=target - base, axis=self.yaw_axis, angle=-yaw)
+            for directions in self.__planar_solutions(target=self.to_plane(plane_target), current=current):
+                turns = np.diff(np.concatenate(([0.], directions - self.rest_directions)))
+                candidate = pose.copy()
+                for j, a, s, turn in zip(self.planar, axes, self.signs, turns):
+                    candidate[j, a] = skeleton.rest_angles[j, a] - s*turn
+                candidates.append(candidate)
+        candidates = np.array(candidates)
+        # angles are defined modulo 2 pi, bring the chain angles next to the rest angles
+        wrapped = skeleton.rest_angles + (candidates - skeleton.rest_angles + np.pi) % (2*np.pi) - np.pi
+        candidates = np.where(self.mask, wrapped, candidates)
+        return np.clip(candidates, skeleton.angles_min, skeleton.angles_max)
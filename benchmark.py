@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tracemalloc
+import numpy as np
+from typing import List, Dict, Any, Optional
+from config_parser import RobotConfigParser
+from robot import Robot, GradientMode, Optimizer
+from kernels import default_backend
+
+CONFIGS_DIR = os.path.join('.', 'resources', 'configs')
+
+# solver modes benchmarked one target at a time, keyword arguments of Robot.inverse_kinematics
+SOLVER_MODES: Dict[str, Dict[str, Any]] = {
+    "adam_finite_differences": dict(optimizer=Optimizer.ADAM, gradient=GradientMode.FINITE_DIFFERENCES),
+    "adam_jacobian": dict(optimizer=Optimizer.ADAM, gradient=GradientMode.JACOBIAN),
+    "levenberg_marquardt": dict(optimizer=Optimizer.LEVENBERG_MARQUARDT),
+    "multi_chain": dict(optimizer=Optimizer.MULTI_CHAIN),
+    "analytic": dict(optimizer=Optimizer.ANALYTIC),
+}
+# mode solving all the targets with a single Robot.batch_inverse_kinematics call
+BATCH_MODE = "batch_adam"
+
+
+def end_effectors(robot: Robot) -> List[int]:
+    """
+        Joints without childs
+    """
+    return [j for j, childs in enumerate(robot.skeleton.edges) if len(childs) == 0]
+
+
+def sample_targets(robot: Robot, joints_id: List[int], n_targets: int, seed: int) -> np.array:
+    """
+        Reachable targets: forward kinematics of actuators angles sampled within the constraints
+
+        return np.array -> shape = (n_targets, len(joints_id), 3), one target for each joint in joints_id
+    """
+    rng = np.random.default_rng(seed)
+    angles = robot.skeleton.sample_angles(n_samples=n_targets, rng=rng)
+    locations, _ = robot.skeleton.batch_forward_kinematics(angles=angles)
+    return locations[:, joints_id]
+
+
+def summarize(latencies: np.array, iterations: np.array, errors: np.array, converged: np.array,
+              n_effectors: int, success_tol: float, peak_memory: int) -> Dict[str, Any]:
+    """
+        A solve is successful when the root mean square distance of the joints from their targets is below success_tol
+    """
+    rms = np.sqrt(np.asarray(errors)/n_effectors)
+    return {
+        "latency_s": {
+            "p50": float(np.percentile(latencies, 50)),
+            "p90": float(np.percentile(latencies, 90)),
+            "p99": float(np.percentile(latencies, 99)),
+            "mean": float(np.mean(latencies)),
+            "max": float(np.max(latencies)),
+        },
+        "iterations": {
+            "mean": float(np.mean(iterations)),
+            "p50": float(np.percentile(iterations, 50)),
+            "max": int(np.max(iterations)),
+        },
+        "converged_rate": float(np.mean(converged)),
+        "success_rate": float(np.mean(rms <= success_tol)),
+        "final_error": {
+            "mean": float(np.mean(errors)),
+            "p50": float(np.percentile(errors, 50)),
+            "max": float(np.max(errors)),
+        },
+        "peak_memory_bytes": peak_memory,
+    }
+
+
+def solve(robot: Robot, mode: str, targets: np.array, joints_id: List[int], lr: float, atol: float,
+          max_iterations: int) -> Dict[str, np.array]:
+    """
+        Solve every target starting from the rest pose
+
+        return Dict[str, np.array] - latencies, iterations, errors and converged flags, one value for each target
+    """
+    skeleton = robot.skeleton
+    if mode == BATCH_MODE:
+        result = robot.batch_inverse_kinematics(targets=targets, joints_id=joints_id, lr=lr, atol=atol,
+                                                max_iterations=max_iterations, initial_angles=skeleton.rest_angles)
+        # the whole batch is one call, every solve is charged the amortized latency
+        return {"latencies": np.full(shape=(len(targets),), fill_value=result.elapsed/len(targets)),
+                "iterations": result.iterations, "errors": result.errors, "converged": result.converged}
+
+    runs: Dict[str, List] = {"latencies": [], "iterations": [], "errors": [], "converged": []}
+    for target in targets:
+        start = time.perf_counter()
+        result = robot.inverse_kinematics(target=target, joints_id=joints_id, lr=lr, atol=atol,
+                                          warm_start=skeleton.rest_angles, max_iterations=max_iterations,
+                                          **SOLVER_MODES[mode])
+        runs["latencies"].append(time.perf_counter() - start)
+        runs["iterations"].append(result.iterations)
+        runs["errors"].append(result.error)
+        runs["converged"].append(result.converged)
+    return {k: np.array(v) for k, v in runs.items()}
+
+
+def run_mode(robot: Robot, mode: str, targets: np.array, joints_id: List[int], lr: float, atol: float,
+             max_iterations: int, success_tol: float, memory_targets: int) -> Dict[str, Any]:
+    """
+        Timed solves of every target, followed by a traced run over the first memory_targets targets
+        (tracemalloc slows down the allocations, it would distort the latencies)
+    """
+    runs = solve(robot=robot, mode=mode, targets=targets, joints_id=joints_id, lr=lr, atol=atol,
+                 max_iterations=max_iterations)
+    tracemalloc.start()
+    solve(robot=robot, mode=mode, targets=targets[:memory_targets], joints_id=joints_id, lr=lr, atol=atol,
+          max_iterations=max_iterations)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    summary = summarize(latencies=runs["latencies"], iterations=runs["iterations"], errors=runs["errors"],
+                        converged=runs["converged"], n_effectors=len(joints_id), success_tol=success_tol,
+                        peak_memory=peak_memory)
+    summary["solves_per_second"] = float(len(targets)/np.sum(runs["latencies"]))
+    return summary
+
+
+def revision() -> Optional[str]:
+    """
+        Commit of the working tree, None outside of a git repository
+    """
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return out.stdout.strip() if out.returncode == 0 else None
+
+
+def run_benchmark(config_paths: List[str], modes: List[str], n_targets: int, seed: int, lr: float, atol: float,
+                  max_iterations: int, success_tol: float, memory_targets: int) -> Dict[str, Any]:
+    report = {
+        "revision": revision(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "backend": default_backend().value,
+        "parameters": dict(n_targets=n_targets, seed=seed, lr=lr, atol=atol, max_iterations=max_iterations,
+                           success_tol=success_tol, memory_targets=memory_targets),
+        "configs": {},
+    }
+    for path in config_paths:
+        robot = RobotConfigParser(path=path).parse()
+        joints_id = end_effectors(robot=robot)
+        targets = sample_targets(robot=robot, joints_id=joints_id, n_targets=n_targets, seed=seed)
+        results = {}
+        for mode in modes:
+            results[mode] = run_mode(robot=robot, mode=mode, targets=targets, joints_id=joints_id, lr=lr,
+                                     atol=atol, max_iterations=max_iterations, success_tol=success_tol,
+                                     memory_targets=memory_targets)
+            print(f"{os.path.basename(path)} [{mode}] p50 {results[mode]['latency_s']['p50']*1e3:.2f} ms, "
+                  f"success {results[mode]['success_rate']:.0%}", file=sys.stderr)
+        report["configs"][os.path.basename(path)] = {
+            "n_joints": len(robot.skeleton.joints),
+            "joints_id": joints_id,
+            "modes": results,
+        }
+    return report
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Inverse kinematics benchmark over the robot configurations")
+    parser.add_argument("--configs", nargs="*", default=None,
+                        help=f"configuration files, defaults to every .yml file in {CONFIGS_DIR}")
+    parser.add_argument("--modes", nargs="*", default=list(SOLVER_MODES) + [BATCH_MODE],
+                        choices=list(SOLVER_MODES) + [BATCH_MODE])
+    parser.add_argument("--targets", type=int, default=20, help="random targets per configuration")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--lr", type=float, default=.03)
+    parser.add_argument("--atol", type=float, default=0.05)
+    parser.add_argument("--max-iterations", type=int, default=150)
+    parser.add_argument("--success-tol", type=float, default=0.5,
+                        help="root mean square distance from the targets below which a solve is successful")
+    parser.add_argument("--memory-targets", type=int, default=3,
+                        help="targets solved again under tracemalloc to measure the peak memory")
+    parser.add_argument("--output", default=None, help="JSON report path, defaults to stdout")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    config_paths = args.configs or sorted(os.path.join(CONFIGS_DIR, f) for f in os.listdir(CONFIGS_DIR)
+                                          if f.endswith(".yml"))
+    report = run_benchmark(config_paths=config_paths, modes=args.modes, n_targets=args.targets, seed=args.seed,
+                           lr=args.lr, atol=args.atol, max_iterations=args.max_iterations,
+                           success_tol=args.success_tol, memory_targets=args.memory_targets)
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        with open(args.output, "w") as stream:
+            json.dump(report, stream, indent=2)
@@ -0,0 +1,100 @@
+import os
+import sys
+import numpy as np
+from typing import List, Dict, Any
+from config_parser import RobotConfigParser
+from actuator import ActuatorSelector
+from joints import Joint
+from skeleton import Skeleton
+from topology import Topology
+from robot import Robot
+
+# bumped whenever the layout of the compiled arrays changes
+MODEL_VERSION = 2
+
+
+def _to_csr(lists: List[List[int]]) -> Dict[str, np.array]:
+    """
+        Flatten a list of index lists, lists[i] == indices[indptr[i]:indptr[i+1]]
+    """
+    indptr = np.zeros(shape=(len(lists) + 1,), dtype=np.int64)
+    indptr[1:] = np.cumsum([len(l) for l in lists])
+    indices = np.array([i for l in lists for i in l], dtype=np.int64)
+    return {"indptr": indptr, "indices": indices}
+
+
+def _from_csr(indptr: np.array, indices: np.array) -> List[List[int]]:
+    indices = indices.tolist()
+    return [indices[a:b] for a, b in zip(indptr[:-1].tolist(), indptr[1:].tolist())]
+
+
+def compile_model(config_path: str, model_path: str) -> None:
+    """
+        Compile a yaml configuration into a directory of .npy arrays (topology, rest state and actuators),
+        loaded by load_model without any yaml parsing nor skeleton traversal.
+
+        config_path: str - Path to configuration file
+        model_path: str - output directory
+    """
+    parser = RobotConfigParser(path=config_path)
+    skeleton = parser.parse().skeleton
+    # actuators listed joint by joint, in the order they are applied
+    actuators = [(joint["id"], act) for joint in parser.config["Joints"] for act in joint["actuators"]]
+    edges = _to_csr(lists=skeleton.edges)
+    topology = skeleton.topology.to_arrays()
+    arrays = {
+        "version": np.array(MODEL_VERSION),
+        "edges_indptr": edges["indptr"],
+        "edges_indices": edges["indices"],
+        # preorder of the joints, each subtree is a contiguous slice of it
+        "topology_parents": topology["parents"],
+        "topology_order": topology["order"],
+        "rest_locations": skeleton.rest_locations,
+        "rest_bases": skeleton.rest_bases,
+        "actuators_joint": np.array([j for j, _ in actuators], dtype=np.int64).reshape(-1),
+        "actuators_type": np.array([act["type"] for _, act in actuators], dtype=str).reshape(-1),
+        "actuators_axis": np.array([act["axis"] for _, act in actuators], dtype=np.int64).reshape(-1),
+        "actuators_start_angle": np.array([act["start_angle"] for _, act in actuators], dtype=np.float64).reshape(-1),
+        # constraints as written in the configuration (degrees)
+        "actuators_constraints": np.array([[act["constraints"]["min"], act["constraints"]["max"]] for _, act in actuators],
+                                          dtype=np.float64).reshape(-1, 2),
+    }
+    os.makedirs(model_path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(model_path, name + ".npy"), array)
+
+
+def load_model(model_path: str, mmap: bool = True) -> Robot:
+    """
+        Load a model written by compile_model.
+
+        mmap: bool - memory map the arrays (read only), processes loading the same model share their pages
+        return Robot
+    """
+    mode = "r" if mmap else None
+    arrays = {f[:-len(".npy")]: np.load(os.path.join(model_path, f), mmap_mode=mode)
+              for f in os.listdir(model_path) if f.endswith(".npy")}
+    if int(arrays["version"]) != MODEL_VERSION:
+        raise ValueError(f"{model_path}: compiled model version {int(arrays['version'])}, expected {MODEL_VERSION}")
+
+    n_joints = len(arrays["rest_locations"])
+    actuators: List[List[Any]] = [[] for _ in range(n_joints)]
+    for j, act_type, axis, start_angle, (c_min, c_max) in zip(arrays["actuators_joint"].tolist(),
+                                                              arrays["actuators_type"].tolist(),
+                                                              arrays["actuators_axis"].tolist(),
+                                                              arrays["actuators_start_angle"].tolist(),
+                                                              arrays["actuators_constraints"].tolist()):
+        actuators[j].append(ActuatorSelector[act_type].value(axis=axis, start_angle=start_angle,
+                                                             constraints={"min": c_min, "max": c_max}))
+    skeleton = Skeleton.from_arrays(joints=[Joint(id=j, actuators=actuators[j]) for j in range(n_joints)],
+                                    edges=_from_csr(indptr=arrays["edges_indptr"], indices=arrays["edges_indices"]),
+                                    topology=Topology.from_arrays(parents=arrays["topology_parents"],
+                                                                  order=arrays["topology_order"]),
+                                    rest_locations=arrays["rest_locations"],
+                                    rest_bases=arrays["rest_bases"])
+    return Robot.from_skeleton(skeleton=skeleton)
+
+
+if __name__ == "__main__":
+    # python compiled_model.py <config.yml> <model directory>
+    compile_model(config_path=sys.argv[1], model_path=sys.argv[2])
@@ -1,4 +1,5 @@
 import yaml 
+from typing import Dict, Any
 from robot import Robot
 from actuator import ActuatorSelector
 from joints import Joint
@@ -15,6 +16,15 @@ class RobotConfigParser:
                 print(exc)       
                 exit(-1)
 
+    @classmethod
+    def from_dict(cls, config: Dict[str, Any]) -> "RobotConfigParser":
+        """
+            config: Dict[str, Any] - configuration already loaded (same structure of the yaml files)
+        """
+        parser = cls.__new__(cls)
+        parser.config = config
+        return parser
+
     def parse(self) -> Robot:
         """            
             return Robot
@@ -27,7 +37,7 @@ class RobotConfigParser:
             for act in joint["actuators"]:
                 # Dynamically create actuators instances
                 d = ActuatorSelector[act["type"]].value
-                del act['type']            
+                act = {k: v for k, v in act.items() if k != 'type'}
                 d_inst = d.__new__(d, **act)
                 d_inst.__init__(**act)                
                 actuators.append(d_inst)        
@@ -0,0 +1,97 @@
+import os
+import time
+import multiprocessing
+import numpy as np
+from dataclasses import dataclass
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Union
+from config_parser import RobotConfigParser
+from compiled_model import load_model
+from robot import Robot, GradientMode
+
+
+@dataclass
+class IKRequest:
+    target: np.array
+    joints_id: List[int]
+    lr: float = .03
+    atol: float = 0.05
+    warm_start: Optional[np.array] = None  # (n_joints, 3) actuators angles, defaults to the rest pose
+
+
+@dataclass
+class IKResponse:
+    angles: np.array  # (n_joints, 3) actuators angles, same layout of Skeleton.get_angles
+    converged: bool
+    error: float
+    iterations: int
+    elapsed: float    # seconds spent by the worker on the request
+
+
+# robot owned by each worker process, created once by _init_worker
+_worker_robot: Optional[Robot] = None
+_worker_gradient: GradientMode = GradientMode.JACOBIAN
+
+
+def _init_worker(config: Union[Dict[str, Any], str], gradient: GradientMode) -> None:
+    """
+        config: configuration already loaded or path of a compiled model (memory mapped by every worker)
+    """
+    global _worker_robot, _worker_gradient
+    if isinstance(config, str):
+        _worker_robot = load_model(model_path=config)
+    else:
+        _worker_robot = RobotConfigParser.from_dict(config=config).parse()
+    _worker_gradient = gradient
+
+
+def _solve(request: IKRequest) -> IKResponse:
+    """
+        Solve a request on the worker robot, every request starts from the rest pose or from its warm start
+    """
+    start = time.perf_counter()
+    skeleton = _worker_robot.skeleton
+    warm_start = skeleton.rest_angles if request.warm_start is None else request.warm_start
+    result = _worker_robot.inverse_kinematics(target=np.asarray(request.target, dtype=np.float64),
+                                              joints_id=request.joints_id,
+                                              lr=request.lr,
+                                              atol=request.atol,
+                                              gradient=_worker_gradient,
+                                              warm_start=warm_start)
+    return IKResponse(angles=result.angles, converged=result.converged, error=result.error,
+                      iterations=result.iterations, elapsed=time.perf_counter() - start)
+
+
+class IKService:
+    def __init__(self, config_path: str, processes: Optional[int] = None,
+                 gradient: GradientMode = GradientMode.JACOBIAN) -> None:
+        """
+            Pool of headless solvers sharing the same robot.
+            The configuration is parsed once and shipped to each worker when it starts,
+            requests only carry the target and the solver parameters.
+
+            config_path: str - Path to configuration file or to a compiled model directory (see compiled_model.py),
+                               workers map the compiled arrays read only instead of parsing the configuration
+            processes: int - number of workers, defaults to the number of cores
+            gradient: GradientMode - how the workers estimate the derivatives of the cost function
+        """
+        config = config_path if os.path.isdir(config_path) else RobotConfigParser(path=config_path).config
+        self.pool = multiprocessing.Pool(processes=processes, initializer=_init_worker,
+                                         initargs=(config, gradient))
+
+    def solve(self, requests: Iterable[IKRequest], chunksize: int = 1) -> Iterator[IKResponse]:
+        """
+            Solve a stream of requests, responses are returned in the same order of the requests.
+
+            chunksize: int - requests sent to a worker at once, larger values reduce the inter-process traffic
+        """
+        return self.pool.imap(_solve, requests, chunksize)
+
+    def close(self) -> None:
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self) -> "IKService":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
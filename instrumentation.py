@@ -0,0 +1,130 @@
+from __future__ import annotations
+import io
+import json
+import time
+import pstats
+import cProfile
+import contextlib
+import numpy as np
+from collections import defaultdict
+from dataclasses import dataclass, field, asdict
+from typing import List, Dict, Any, Optional, ContextManager
+
+# instrumentation collecting the measures, None when disabled (see Instrumentation.__enter__)
+_active: Optional[Instrumentation] = None
+_disabled_phase = contextlib.nullcontext()
+
+
+def active() -> Optional[Instrumentation]:
+    return _active
+
+
+def count(name: str, n: int = 1) -> None:
+    """
+        Increase a counter of the active instrumentation, no-op when disabled
+    """
+    if _active is not None:
+        _active.counters[name] += n
+
+
+def phase(name: str) -> ContextManager:
+    """
+        Time the enclosed block as phase name, no-op when disabled
+    """
+    if _active is None:
+        return _disabled_phase
+    return _active.phase(name=name)
+
+
+@dataclass
+class SolveTrace:
+    optimizer: str
+    joints_id: List[int]
+    target: List[float]
+    errors: List[float] = field(default_factory=list)      # cost function after each iteration
+    step_sizes: List[float] = field(default_factory=list)  # largest actuator angle change (rad) of each iteration
+    reason: str = ""                                       # converged, stalled, max_iterations or unreachable
+    elapsed: float = 0.0                                   # seconds
+
+
+class Instrumentation:
+    def __init__(self, profile: bool = False) -> None:
+        """
+            Timers, counters and per solve traces of the solver, active inside a with block:
+
+                with Instrumentation() as instrumentation:
+                    robot.inverse_kinematics(...)
+                instrumentation.to_json(path='stats.json')
+
+            Counters: iterations, cost_evaluations, gradient_evaluations, shadow_copies, actuator_calls, clamps.
+            Phases (seconds and calls): inverse_kinematics, shadow, cost, actuation, gradient, jacobian,
+            linear_solve, closed_form, observers.
+
+            profile: bool - also run cProfile while active (see dump_profile)
+        """
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.timers: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.traces: List[SolveTrace] = []
+        self.profiler: Optional[cProfile.Profile] = cProfile.Profile() if profile else None
+        self.__previous: Optional[Instrumentation] = None
+
+    def __enter__(self) -> Instrumentation:
+        global _active
+        self.__previous, _active = _active, self
+        if self.profiler is not None:
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, *args) -> None:
+        global _active
+        if self.profiler is not None:
+            self.profiler.disable()
+        _active = self.__previous
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[name] += time.perf_counter() - start
+            self.calls[name] += 1
+
+    def begin_solve(self, optimizer: str, joints_id: List[int], target: np.array) -> SolveTrace:
+        trace = SolveTrace(optimizer=optimizer, joints_id=[int(j) for j in joints_id],
+                           target=np.asarray(target, dtype=np.float64).tolist())
+        self.traces.append(trace)
+        return trace
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "counters": dict(self.counters),
+            "phases": {name: {"seconds": self.timers[name], "calls": self.calls[name]} for name in self.timers},
+            "solves": [asdict(trace) for trace in self.traces],
+        }
+
+    def to_json(self, path: Optional[str] = None) -> str:
+        """
+            JSON export of to_dict, written to path if provided
+        """
+        out = json.dumps(self.to_dict(), indent=2)
+        if path is not None:
+            with open(path, "w") as stream:
+                stream.write(out)
+        return out
+
+    def dump_profile(self, path: str) -> None:
+        """
+            Write the cProfile statistics (readable with pstats or snakeviz)
+        """
+        if self.profiler is None:
+            raise ValueError("profiling is disabled, create the Instrumentation with profile=True")
+        self.profiler.dump_stats(path)
+
+    def profile_summary(self, n_lines: int = 20, sort: str = "cumulative") -> str:
+        if self.profiler is None:
+            raise ValueError("profiling is disabled, create the Instrumentation with profile=True")
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats(sort).print_stats(n_lines)
+        return out.getvalue()
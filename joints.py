@@ -1,37 +1,66 @@
 import numpy as np
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable
 from actuator import Actuator
 from dataclasses import dataclass
 import utils
 
 @dataclass
 class Joint:
+    """
+        Joint of a skeleton, location and basis are read only views onto the skeleton state arrays,
+        the skeleton recomposes them (Skeleton.update) before they are returned.
+    """
     id: int
     actuators: List[Actuator]
-    location: Optional[np.array] = None
-    basis: Optional[np.array] = None
 
     def __post_init__(self) -> None:
-        self.location = np.zeros(shape=(1, 3))
-        self.basis = np.eye(3)
+        self.bind_state(location=np.zeros(shape=(3,)), basis=np.eye(3))
 
-    @property
-    def config(self) -> Dict[str, Any]:
-        return {
-            "coords": self.location,
-            "basis": self.basis,           
+    def bind_state(self, location: np.array, basis: np.array, refresh: Optional[Callable[[], None]] = None) -> None:
+        """
+            Make the joint a view onto the provided location and basis arrays.
+
+            location: np.array -> shape = (3,)
+            basis: np.array -> shape = (3, 3)
+            refresh: Callable - brings the arrays up to date, called before location and basis are read
+        """
+        self._location = location
+        self._basis = basis
+        self._refresh = refresh
+        self._config = {
+            "coords": self._location,
+            "basis": self._basis,           
             "id" : self.id 
         }
+
+    @property
+    def location(self) -> np.array:
+        return self.__read(array=self._location)
+
+    @property
+    def basis(self) -> np.array:
+        return self.__read(array=self._basis)
+
+    def __read(self, array: np.array) -> np.array:
+        if self._refresh is not None:
+            self._refresh()
+        view = array.view()
+        view.flags.writeable = False
+        return view
+
+    @property
+    def config(self) -> Dict[str, Any]:
+        return self._config
     
     def align_basis_to_target_z(self, target_z: np.array) -> None:
         """
             Align joint basis to target z direction. 
         """
-        current_z = self.basis[2, :]            
+        current_z = self._basis[2, :]            
         q = utils.from_2_vec_to_quat(v1=current_z, v2=target_z)                
-        self.basis[0, :] = utils.qv_mult(v1=self.basis[0, :], q1=q)
-        self.basis[1, :] = utils.qv_mult(v1=self.basis[1, :], q1=q)            
-        self.basis[2, :] = target_z
+        self._basis[0, :] = utils.qv_mult(v1=self._basis[0, :], q1=q)
+        self._basis[1, :] = utils.qv_mult(v1=self._basis[1, :], q1=q)            
+        self._basis[2, :] = target_z
 
     def rotate_basis_by_angles(self, angles: np.array) -> None:
         """
@@ -39,20 +68,23 @@ class Joint:
 
             angles: np.array -> shape = (1, 3)  :: np.array([x_angle, y_angle, z_angle])
         """        
-        utils.rotate_basis_by_angles(angles=angles, basis=self.basis)
+        utils.rotate_basis_by_angles(angles=angles, basis=self._basis)
 
-    def apply_command(self, childs_configs: List[Dict[str, Any]], command: np.array) -> None:     
+    def apply_command(self, command: np.array) -> None:     
         """
-            Apply rototraslation deltas. 
+            Apply rotation deltas to the joint actuators (see Skeleton.process_command).
         """
         for act in self.actuators:
             if command[act.axis] != 0:
-                for c_cfg in childs_configs:  # parallelize this loop                                 
-                    # update child basis 
-                    act.actuate(child_config=c_cfg,
-                                parent_config=self.config,                                             
-                                command=command)   
-                # update joint_id basis    
-                act.actuate(child_config=self.config,
-                        parent_config=self.config,                                             
-                        command=command)               
\ No newline at end of file
+                act.actuate(command=command)
+
+    def local_rotation(self, rest_basis: np.array) -> np.array:
+        """
+            Rotation of the joint system due to its actuators, applied in the order they are listed.
+
+            rest_basis: np.array -> shape = (3, 3), joint basis in the rest state
+        """
+        rotation = np.eye(3)
+        for act in self.actuators:
+            rotation = rotation @ act.rotation(rest_basis=rest_basis)
+        return rotation
@@ -0,0 +1,245 @@
+from __future__ import annotations
+import os
+import math
+import argparse
+import numpy as np
+from enum import Enum
+from dataclasses import dataclass
+from typing import Dict, Tuple, Optional, TYPE_CHECKING
+if TYPE_CHECKING:
+    from skeleton import Skeleton
+    from robot import Robot
+
+try:
+    import numba
+except ImportError:  # optional dependency, the NumPy backend is used instead
+    numba = None
+
+NUMBA_AVAILABLE = numba is not None
+
+
+class Backend(Enum):
+    NUMPY = "numpy"  # vectorized Skeleton.batch_forward_kinematics and Robot.batch_cost_gradient
+    NUMBA = "numba"  # single compiled pass over the skeleton arrays (see _evaluate)
+
+
+def default_backend() -> Backend:
+    """
+        Backend selected by the IK_BACKEND environment variable (numpy or numba),
+        NUMBA when it is installed otherwise
+    """
+    name = os.environ.get("IK_BACKEND")
+    if name is not None:
+        return check_available(backend=Backend(name.lower()))
+    return Backend.NUMBA if NUMBA_AVAILABLE else Backend.NUMPY
+
+
+def check_available(backend: Backend) -> Backend:
+    if backend == Backend.NUMBA and not NUMBA_AVAILABLE:
+        raise ValueError("the numba backend requires numba (pip install numba)")
+    return backend
+
+
+def _evaluate(angles: np.array, targets: np.array, weights: np.array, joints_id: np.array, order: np.array,
+              parents: np.array, rest_locations: np.array, rest_bases: np.array, rest_angles: np.array,
+              angles_min: np.array, angles_max: np.array, actuators_indptr: np.array, actuators_axis: np.array,
+              clamped: np.array, locations: np.array, bases: np.array, costs: np.array, gradient: np.array) -> None:
+    """
+        Clamping, forward kinematics, cost function and gradient of a stack of actuators angles, written with
+        scalar loops only so that numba can compile it (it runs, slowly, as plain Python as well).
+        Same conventions of Skeleton.batch_forward_kinematics and Robot.batch_cost_gradient.
+
+        angles: np.array -> shape = (B, n_joints, 3)
+        targets: np.array -> shape = (B, K, 3)
+        weights: np.array -> shape = (B, K)
+        actuators_indptr, actuators_axis: np.array - actuators of joint j are actuators_axis[indptr[j]:indptr[j+1]],
+                                                     in the order they are applied
+        clamped, locations, bases, costs, gradient: np.array - outputs, shapes = (B, n_joints, 3),
+                                                               (B, n_joints, 3), (B, n_joints, 3, 3), (B,), (B, n_joints, 3)
+    """
+    n_batch, n_joints = angles.shape[0], angles.shape[1]
+    world = np.empty((n_joints, 3, 3))
+    # world axis of each actuator
+    axes = np.zeros((n_joints, 3, 3))
+    local = np.empty((3, 3))
+    rotation = np.empty((3, 3))
+    product = np.empty((3, 3))
+    axis = np.empty(3)
+    for b in range(n_batch):
+        for j in range(n_joints):
+            for i in range(3):
+                clamped[b, j, i] = min(max(angles[b, j, i], angles_min[j, i]), angles_max[j, i])
+
+        for j in order:
+            p = parents[j]
+            for r in range(3):
+                for c in range(3):
+                    local[r, c] = 1.0 if r == c else 0.0
+            for k in range(actuators_indptr[j], actuators_indptr[j + 1]):
+                i = actuators_axis[k]
+                # the actuator rotates around its rest axis moved by the previous actuators and by the parents
+                for r in range(3):
+                    axis[r] = local[r, 0]*rest_bases[j, i, 0] + local[r, 1]*rest_bases[j, i, 1] + \
+                              local[r, 2]*rest_bases[j, i, 2]
+                for r in range(3):
+                    if p >= 0:
+                        axes[j, i, r] = world[p, r, 0]*axis[0] + world[p, r, 1]*axis[1] + world[p, r, 2]*axis[2]
+                    else:
+                        axes[j, i, r] = axis[r]
+                # rotation matrix of the quaternion (see utils.batch_axisangle_to_q and utils.q_to_matrix)
+                norm = math.sqrt(rest_bases[j, i, 0]**2 + rest_bases[j, i, 1]**2 + rest_bases[j, i, 2]**2)
+                half_theta = (clamped[b, j, i] - rest_angles[j, i])/2.0
+                w = math.cos(half_theta)
+                sin_half = math.sin(half_theta)/norm
+                x, y, z = rest_bases[j, i, 0]*sin_half, rest_bases[j, i, 1]*sin_half, rest_bases[j, i, 2]*sin_half
+                rotation[0, 0] = 1 - 2*(y*y + z*z)
+                rotation[0, 1] = 2*(x*y + w*z)
+                rotation[0, 2] = 2*(x*z - w*y)
+                rotation[1, 0] = 2*(x*y - w*z)
+                rotation[1, 1] = 1 - 2*(x*x + z*z)
+                rotation[1, 2] = 2*(y*z + w*x)
+                rotation[2, 0] = 2*(x*z + w*y)
+                rotation[2, 1] = 2*(y*z - w*x)
+                rotation[2, 2] = 1 - 2*(x*x + y*y)
+                for r in range(3):
+                    for c in range(3):
+                        product[r, c] = local[r, 0]*rotation[0, c] + local[r, 1]*rotation[1, c] + \
+                                        local[r, 2]*rotation[2, c]
+                local[:, :] = product
+
+            if p >= 0:
+                for r in range(3):
+                    for c in range(3):
+                        world[j, r, c] = world[p, r, 0]*local[0, c] + world[p, r, 1]*local[1, c] + \
+                                         world[p, r, 2]*local[2, c]
+                    locations[b, j, r] = locations[b, p, r] + \
+                        world[p, r, 0]*(rest_locations[j, 0] - rest_locations[p, 0]) + \
+                        world[p, r, 1]*(rest_locations[j, 1] - rest_locations[p, 1]) + \
+                        world[p, r, 2]*(rest_locations[j, 2] - rest_locations[p, 2])
+            else:
+                world[j, :, :] = local
+                locations[b, j, :] = rest_locations[j]
+            for r in range(3):
+                for c in range(3):
+                    bases[b, j, r, c] = rest_bases[j, r, 0]*world[j, c, 0] + rest_bases[j, r, 1]*world[j, c, 1] + \
+                                        rest_bases[j, r, 2]*world[j, c, 2]
+
+        costs[b] = 0.0
+        gradient[b, :, :] = 0.0
+        for k in range(len(joints_id)):
+            e = joints_id[k]
+            d0 = locations[b, e, 0] - targets[b, k, 0]
+            d1 = locations[b, e, 1] - targets[b, k, 1]
+            d2 = locations[b, e, 2] - targets[b, k, 2]
+            costs[b] += weights[b, k]*(d0*d0 + d1*d1 + d2*d2)
+            d0, d1, d2 = weights[b, k]*d0, weights[b, k]*d1, weights[b, k]*d2
+            # actuators move e when they belong to one of its ancestors, d(loc)/d(angle) = lever x axis
+            a = parents[e]
+            while a >= 0:
+                l0 = locations[b, e, 0] - locations[b, a, 0]
+                l1 = locations[b, e, 1] - locations[b, a, 1]
+                l2 = locations[b, e, 2] - locations[b, a, 2]
+                for m in range(actuators_indptr[a], actuators_indptr[a + 1]):
+                    i = actuators_axis[m]
+                    u0, u1, u2 = axes[a, i, 0], axes[a, i, 1], axes[a, i, 2]
+                    gradient[b, a, i] += 2*(d0*(l1*u2 - l2*u1) + d1*(l2*u0 - l0*u2) + d2*(l0*u1 - l1*u0))
+                a = parents[a]
+
+        # actuators lying on a constraint can not follow the descent direction
+        for j in range(n_joints):
+            for i in range(3):
+                g = gradient[b, j, i]
+                if (clamped[b, j, i] >= angles_max[j, i] and g < 0) or (clamped[b, j, i] <= angles_min[j, i] and g > 0):
+                    gradient[b, j, i] = 0.0
+
+
+_compiled_evaluate = numba.njit(cache=True)(_evaluate) if NUMBA_AVAILABLE else _evaluate
+
+
+@dataclass
+class SkeletonArrays:
+    order: np.array             # (n_joints,) parents before their childs
+    parents: np.array           # (n_joints,) -1 for roots
+    rest_locations: np.array    # (n_joints, 3)
+    rest_bases: np.array        # (n_joints, 3, 3)
+    rest_angles: np.array       # (n_joints, 3)
+    angles_min: np.array        # (n_joints, 3) RotaryActuator constraints (rad)
+    angles_max: np.array        # (n_joints, 3)
+    actuators_indptr: np.array  # (n_joints + 1,)
+    actuators_axis: np.array    # (n_actuators,) basis axis of each actuator, joint by joint in the order they are applied
+
+    @classmethod
+    def from_skeleton(cls, skeleton: Skeleton) -> SkeletonArrays:
+        def contiguous(a: np.array, dtype: type = np.float64) -> np.array:
+            return np.ascontiguousarray(a, dtype=dtype)
+
+        indptr = np.zeros(shape=(len(skeleton.joints) + 1,), dtype=np.int64)
+        indptr[1:] = np.cumsum([len(j.actuators) for j in skeleton.joints])
+        return cls(order=contiguous(skeleton.order, np.int64), parents=contiguous(skeleton.parents, np.int64),
+                   rest_locations=contiguous(skeleton.rest_locations), rest_bases=contiguous(skeleton.rest_bases),
+                   rest_angles=contiguous(skeleton.rest_angles), angles_min=contiguous(skeleton.angles_min),
+                   angles_max=contiguous(skeleton.angles_max), actuators_indptr=indptr,
+                   actuators_axis=np.array([act.axis for j in skeleton.joints for act in j.actuators], dtype=np.int64))
+
+    def evaluate(self, angles: np.array, targets: np.array, weights: np.array,
+                 joints_id: np.array) -> Tuple[np.array, np.array, np.array, np.array, np.array]:
+        """
+            Run the compiled kernel (plain Python when numba is missing), see _evaluate
+
+            return (clamped, locations, bases, costs, gradient)
+        """
+        n_batch, n_joints = angles.shape[0], angles.shape[1]
+        clamped = np.empty(shape=(n_batch, n_joints, 3))
+        locations = np.empty(shape=(n_batch, n_joints, 3))
+        bases = np.empty(shape=(n_batch, n_joints, 3, 3))
+        costs = np.empty(shape=(n_batch,))
+        gradient = np.empty(shape=(n_batch, n_joints, 3))
+        _compiled_evaluate(np.ascontiguousarray(angles, dtype=np.float64), np.ascontiguousarray(targets, dtype=np.float64),
+                           np.ascontiguousarray(weights, dtype=np.float64), np.asarray(joints_id, dtype=np.int64),
+                           self.order, self.parents, self.rest_locations, self.rest_bases, self.rest_angles,
+                           self.angles_min, self.angles_max, self.actuators_indptr, self.actuators_axis,
+                           clamped, locations, bases, costs, gradient)
+        return clamped, locations, bases, costs, gradient
+
+
+def compare_backends(robot: Robot, joints_id: Optional[list] = None, n_samples: int = 64,
+                     seed: int = 0) -> Dict[str, float]:
+    """
+        Largest absolute difference between the kernel (compiled when numba is installed, interpreted otherwise)
+        and the NumPy backend
+        on random poses, sampled beyond the actuators constraints to exercise the clamping, and random targets.
+
+        joints_id: List[int] - joints of the cost function, defaults to every joint
+        return Dict[str, float] - difference of the locations, bases, costs and gradient
+    """
+    skeleton = robot.skeleton
+    joints_id = list(range(len(skeleton.joints))) if joints_id is None else list(joints_id)
+    rng = np.random.default_rng(seed)
+    angles = skeleton.sample_angles(n_samples=n_samples, rng=rng)*1.2
+    targets = skeleton.rest_locations[joints_id] + rng.normal(scale=5.0, size=(n_samples, len(joints_id), 3))
+    weights = rng.uniform(.5, 2, size=(len(joints_id),))
+    reference = robot.batch_evaluate(angles=angles, targets=targets, joints_id=joints_id, weights=weights,
+                                     backend=Backend.NUMPY)
+    _, *evaluated = SkeletonArrays.from_skeleton(skeleton=skeleton).evaluate(
+        angles=angles, targets=targets, weights=np.broadcast_to(weights, (n_samples, len(joints_id))), joints_id=joints_id)
+    return {name: float(np.max(np.abs(a - b)))
+            for name, a, b in zip(("locations", "bases", "costs", "gradient"), evaluated, reference)}
+
+
+if __name__ == "__main__":
+    from config_parser import RobotConfigParser
+    parser = argparse.ArgumentParser(description="Check the compiled kernel against the NumPy backend")
+    parser.add_argument("configs", nargs="+", help="configuration files")
+    parser.add_argument("--samples", type=int, default=64)
+    parser.add_argument("--rtol", type=float, default=1e-9)
+    args = parser.parse_args()
+
+    failed = False
+    for config in args.configs:
+        robot = RobotConfigParser(path=config).parse()
+        differences = compare_backends(robot=robot, n_samples=args.samples)
+        scale = max(float(np.max(np.abs(robot.skeleton.rest_locations))), 1.0)
+        ok = all(d <= args.rtol*scale**2 for d in differences.values())
+        failed |= not ok
+        print(f"{config}: {'ok' if ok else 'MISMATCH'} {differences}")
+    raise SystemExit(1 if failed else 0)
@@ -1,6 +1,7 @@
 import os
 import numpy as np 
 from config_parser import RobotConfigParser
+from observers import PlotObserver
 
 # 2 joints unconstrained
 #CONFIG_PATH = os.path.join('.', 'resources', 'configs', 'armConfig - 2 joints.yml')
@@ -21,6 +22,7 @@ JOINTS_IDS = [7, 8, 11, 16, 17]
 if __name__ == "__main__": 
     # Get robot instance from config file
     robot = RobotConfigParser(path=CONFIG_PATH).parse()    
+    robot.add_observer(PlotObserver())
     
     targets = [
                 np.array([-30, 1, 5]),              
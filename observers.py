@@ -0,0 +1,116 @@
+import numpy as np
+from abc import ABC
+from typing import List, Dict, Any
+
+
+class SolverObserver(ABC):
+    """
+        Consumer of the solver progress, attach it with Robot.add_observer.
+        The solver does not depend on any view: rendering, recording and logging are observers.
+    """
+    def on_iteration(self, robot: Any, target: np.array, iteration: int) -> None:
+        pass
+
+    def on_solve_end(self, robot: Any, target: np.array, result: Any) -> None:
+        pass
+
+
+def draw_skeleton(ax: Any, locations: np.array, bases: np.array, edges: List[List[int]], target: np.array) -> None:
+    """
+        Draw joints basis, bones and target onto a 3d matplotlib axis.
+
+        locations: np.array -> shape = (n_joints, 3)
+        bases: np.array -> shape = (n_joints, 3, 3)
+    """
+    ax.clear()
+    ax.set_xlim(-20, 20)
+    ax.set_ylim(-20, 20)
+    ax.set_zlim(0, 20)
+    ax.set_xlabel('X')
+    ax.set_ylabel('Y')
+    ax.set_zlabel('Z')
+    target = np.asarray(target).reshape(-1, 3)
+    ax.plot(target[:, 0], target[:, 1], target[:, 2], marker='*', linestyle='')
+
+    # plot joints basis, straight segments only need their end points
+    for axis, color in enumerate(['b', 'g', 'r']):
+        for loc, basis in zip(locations, bases):
+            ax.plot(*np.stack((loc, loc + basis[axis])).T, color=color)
+
+    # plot skeleton bones, bones leaving the root are red
+    for parent, childs in enumerate(edges):
+        for child in childs:
+            ax.plot(*np.stack((locations[parent], locations[child])).T, zdir='z', color='r' if parent == 0 else 'b')
+
+
+class PlotObserver(SolverObserver):
+    def __init__(self, every: int = 1, pause: float = 0.0001) -> None:
+        """
+            Render the skeleton while the solver runs.
+
+            every: int - render one iteration every `every` iterations
+            pause: float - seconds given to matplotlib to refresh the window
+        """
+        import matplotlib.pyplot as plt
+        self.plt = plt
+        self.every = every
+        self.pause = pause
+        self.plot = plt.figure().add_subplot(projection='3d')
+
+    def on_iteration(self, robot: Any, target: np.array, iteration: int) -> None:
+        if iteration % self.every == 0:
+            draw_skeleton(ax=self.plot, locations=robot.skeleton.locations, bases=robot.skeleton.bases,
+                          edges=robot.skeleton.edges, target=target)
+            self.plt.pause(self.pause)
+
+
+class FrameRecorder(SolverObserver):
+    def __init__(self, path: str, every: int = 1) -> None:
+        """
+            Record the skeleton state for offline replay (see replay).
+
+            path: str - .npz file written by save
+            every: int - record one iteration every `every` iterations
+        """
+        self.path = path
+        self.every = every
+        self.edges: List[List[int]] = []
+        self.frames: Dict[str, List[np.array]] = {"locations": [], "bases": [], "targets": [], "iterations": []}
+
+    def on_iteration(self, robot: Any, target: np.array, iteration: int) -> None:
+        if iteration % self.every == 0:
+            self.edges = robot.skeleton.edges
+            self.frames["locations"].append(robot.skeleton.locations.copy())
+            self.frames["bases"].append(robot.skeleton.bases.copy())
+            self.frames["targets"].append(np.asarray(target, dtype=np.float64).reshape(-1, 3))
+            self.frames["iterations"].append(iteration)
+
+    def save(self) -> None:
+        """
+            Write the recorded frames, targets are padded to the largest number of targets per frame
+        """
+        n_targets = max([len(t) for t in self.frames["targets"]], default=1)
+        targets = [np.concatenate((t, np.repeat(t[-1:], n_targets - len(t), axis=0))) for t in self.frames["targets"]]
+        parents = np.full(shape=(len(self.edges),), fill_value=-1, dtype=int)
+        for parent, childs in enumerate(self.edges):
+            parents[childs] = parent
+        np.savez(self.path,
+                 locations=np.array(self.frames["locations"]),
+                 bases=np.array(self.frames["bases"]),
+                 targets=np.array(targets).reshape(-1, n_targets, 3),
+                 iterations=np.array(self.frames["iterations"], dtype=int),
+                 parents=parents)
+
+
+def replay(path: str, pause: float = 0.05) -> None:
+    """
+        Render the frames written by FrameRecorder.save
+    """
+    import matplotlib.pyplot as plt
+    frames = np.load(path)
+    parents = frames["parents"]
+    edges = [np.flatnonzero(parents == j).tolist() for j in range(len(parents))]
+    ax = plt.figure().add_subplot(projection='3d')
+    for locations, bases, target in zip(frames["locations"], frames["bases"], frames["targets"]):
+        draw_skeleton(ax=ax, locations=locations, bases=bases, edges=edges, target=target)
+        plt.pause(pause)
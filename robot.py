@@ -1,13 +1,82 @@
 import math
+import time
+import asyncio
 import numpy as np
 from abc import ABC
-from typing import List, Dict
+from enum import Enum
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Iterable, Iterator, AsyncIterator, Callable, Tuple
 from joints import Joint
-import matplotlib.pyplot as plt
 from skeleton import Skeleton
+from observers import SolverObserver
+import instrumentation
+from instrumentation import SolveTrace
+from solution_cache import SolutionCache
+from workspace import WorkspaceMap
+from analytic import PlanarChain
+from kernels import Backend, SkeletonArrays, default_backend, check_available
+
+
+class GradientMode(Enum):
+    FINITE_DIFFERENCES = 0  # probe each actuator on a shadow copy of the skeleton
+    JACOBIAN = 1            # analytic derivative from the current joints basis
+
+
+class Optimizer(Enum):
+    ADAM = 0                 # first order, coordinate wise steps
+    LEVENBERG_MARQUARDT = 1  # damped least squares on the analytic Jacobian
+    MULTI_CHAIN = 2          # damped least squares solving the chains below the shared joints as a stacked problem
+    ANALYTIC = 3             # closed form for planar chains (see PlanarChain), LEVENBERG_MARQUARDT otherwise
+
+
+@dataclass
+class IKResult:
+    angles: np.array     # (n_joints, 3) actuators angles, same layout of Skeleton.get_angles
+    converged: bool      # True if the stopping criteria was met before max_iterations iterations
+    error: float         # final value of the cost function
+    iterations: int
+    reachable: bool = True  # False if the target was rejected by the workspace map, no iteration is run
+    stalled: bool = False   # damped least squares stopped above atol (update below xtol or every actuator locked)
+
+
+@dataclass
+class BatchIKResult:
+    angles: np.array     # (B, n_joints, 3) actuators angles, same layout of Skeleton.get_angles
+    converged: np.array  # (B,) True if the problem met the stopping criteria
+    errors: np.array     # (B,) final value of the cost function
+    iterations: np.array # (B,) iterations run by each problem
+    elapsed: float       # seconds
+
+    @property
+    def solves_per_second(self) -> float:
+        return len(self.angles)/self.elapsed if self.elapsed > 0 else np.inf
+
+
+@dataclass
+class StreamTick:
+    target: np.array
+    angles: np.array        # (n_joints, 3) actuators angles, same layout of Skeleton.get_angles
+    error: float            # value of the cost function for the current pose
+    converged: bool
+    iterations: int         # solver iterations run during the tick
+    latency: float          # seconds from the reception of the target to the answer
+    deadline_missed: bool   # latency exceeded the tick budget
+    missed_deadlines: int   # deadlines missed since the stream started
+
+
+@dataclass
+class TrajectoryResult:
+    angles: np.array      # (T, n_actuators) actuators angles, columns follow Skeleton.actuators_index
+    errors: np.array      # (T,) cost function of each waypoint, from the batched forward kinematics of angles
+    converged: np.array   # (T,) the solver converged and the step did not exceed max_step
+    iterations: np.array  # (T,) solver iterations spent on each waypoint
+    elapsed: float        # seconds
 
 
 class Robot(ABC):    
+    ANGLE_DIST = np.pi/180  # equivalent to 1 deg, finite differences probe
+    MAX_DAMPING = 1e8       # Levenberg-Marquardt damping bound, rejected steps stop growing it beyond
+
     def __init__(self, joints: List[Joint],
                  vertices: Dict[str, List[float]], 
                  edges: List[List[int]]) -> None:
@@ -39,23 +108,67 @@ class Robot(ABC):
                                  joints_loc=np.array(vertices["coords"]).astype(np.float64), 
                                  joints_angles=np.array(vertices["angles"]).astype(np.float64)*np.pi/180,
                                  edges=edges)                                                                                  
-        self.delta_commands = np.zeros(shape=(len(joints), 6))
-        self.plot = plt.figure().add_subplot(projection='3d')    
+        self.__initialize_solver()
+
+    @classmethod
+    def from_skeleton(cls, skeleton: Skeleton) -> "Robot":
+        """
+            skeleton: Skeleton - skeleton already built (e.g. Skeleton.from_arrays)
+        """
+        robot = cls.__new__(cls)
+        robot.skeleton = skeleton
+        robot.__initialize_solver()
+        return robot
+
+    def __initialize_solver(self) -> None:
+        n_joints = len(self.skeleton.joints)
+        self.delta_commands = np.zeros(shape=(n_joints, 6))
+        # consumers of the solver progress (rendering, recording, ...)
+        self.observers: List[SolverObserver] = []
         
         # optimizer parameters 
         self.beta_1 = 0.9
         self.beta_2 = 0.999
         self.epsilon = 1e-8
-        self.momentum: List[float] = []
-        self.s: List[float] = []
+        self.momentum: np.array = np.zeros(shape=(n_joints, 3))
+        self.s: np.array = np.zeros(shape=(n_joints, 3))
+        self.damping: float = 0.0  # Levenberg-Marquardt damping, adapted at every iteration
+        self.stalled: bool = False  # the last damped least squares iteration stopped without reaching atol
+        # closed form of each set of joints, None when the chain does not admit one
+        self.__closed_forms: Dict[Tuple[int, ...], Optional[PlanarChain]] = {}
+        # evaluation of the forward kinematics, cost function and gradient (see batch_evaluate)
+        self.backend: Backend = default_backend()
+        self.__kernel_arrays: Optional[SkeletonArrays] = None
     
     @staticmethod
-    def vertices_distance(pt_list: np.array, target: np.array):
+    def vertices_distance(pt_list: np.array, target: np.array, weights: Optional[np.array] = None):
         """
             Calculate the cost function
+
+            weights: np.array -> shape = (len(pt_list),), weight of each point squared distance (defaults to 1)
+        """
+        instrumentation.count("cost_evaluations")
+        return Robot.batch_vertices_distance(pt_list=pt_list, target=target, weights=weights)
+
+    @staticmethod
+    def batch_vertices_distance(pt_list: np.array, target: np.array, weights: Optional[np.array] = None) -> np.array:
+        """
+            Cost function of a stack of poses, not counted by the instrumentation (see vertices_distance)
+
+            pt_list: np.array -> shape = (..., K, 3)
+            target: np.array -> shape = (3,), (K, 3) or (..., K, 3)
+            weights: np.array -> shape = (K,) or (..., K)
+            return np.array -> shape = (...)
         """
-        return np.sum(np.sum((pt_list - target)**2, axis=1))
+        distances = np.sum((pt_list - target)**2, axis=-1)
+        return np.sum(distances if weights is None else weights*distances, axis=-1)
     
+    def add_observer(self, observer: SolverObserver) -> None:
+        """
+            Notify observer of the progress of inverse_kinematics (see observers.py)
+        """
+        self.observers.append(observer)
+
     def apply_kinematics(self, skeleton: Skeleton, joint_id: int ) -> np.array:           
         """
             Apply commands onto robot skeleton
@@ -64,88 +177,607 @@ class Robot(ABC):
         # Refresh commands
         self.delta_commands[joint_id, :] = np.zeros(shape=(1, 6))  
 
-    def inverse_kinematics(self, target: np.array, joints_id: List[int], lr: float = 10, atol: float = 0.05):  
+    def cost_gradient(self, target: np.array, joints_id: List[int], weights: Optional[np.array] = None) -> np.array:
+        """
+            Gradient of the cost function with respect to the actuators angles.
+
+            return np.array -> shape = (n_joints, 3), same layout of the angular part of delta_commands
+        """
+        instrumentation.count("gradient_evaluations")
+        if self.backend == Backend.NUMBA:
+            # a single compiled pass over the whole skeleton beats the lazy update of the chains
+            target = np.asarray(target, dtype=np.float64)
+            return self.batch_evaluate(angles=self.skeleton.get_angles()[None], targets=target[None], 
+                                       joints_id=joints_id, weights=weights)[3][0]
+        locations, bases = self.skeleton.get_chain_state(joints_id=joints_id)
+        return self.batch_cost_gradient(locations=locations[None], 
+                                        bases=bases[None], 
+                                        angles=self.skeleton.get_angles()[None], 
+                                        targets=np.asarray(target)[None], 
+                                        joints_id=joints_id,
+                                        weights=weights)[0]
+
+    def batch_cost_gradient(self, locations: np.array, bases: np.array, angles: np.array, 
+                            targets: np.array, joints_id: List[int], weights: Optional[np.array] = None) -> np.array:
+        """
+            Gradient of the cost function for a stack of skeleton states.
+
+            locations: np.array -> shape = (B, n_joints, 3)
+            bases: np.array -> shape = (B, n_joints, 3, 3)
+            angles: np.array -> shape = (B, n_joints, 3)
+            targets: np.array -> shape = (B, 3) or (B, len(joints_id), 3)
+            weights: np.array -> shape = (len(joints_id),) or (B, len(joints_id)), see vertices_distance
+            return np.array -> shape = (B, n_joints, 3)
+        """
+        if targets.ndim == 2:
+            targets = targets[:, None, :]
+        jac = self.skeleton.batch_jacobian(locations=locations, bases=bases, angles=angles, joints_id=joints_id)
+        residuals = locations[:, joints_id] - targets
+        if weights is not None:
+            residuals = residuals*np.asarray(weights)[..., None]
+        gradient = 2*np.einsum('bkc,bkcji->bji', residuals, jac)
+
+        # actuators lying on a constraint can not follow the descent direction
+        gradient[((angles >= self.skeleton.angles_max) & (gradient < 0)) | 
+                 ((angles <= self.skeleton.angles_min) & (gradient > 0))] = 0
+        return gradient
+
+    def batch_evaluate(self, angles: np.array, targets: np.array, joints_id: List[int], 
+                       weights: Optional[np.array] = None, 
+                       backend: Optional[Backend] = None) -> Tuple[np.array, np.array, np.array, np.array]:
+        """
+            Forward kinematics, cost function and gradient of a stack of actuators angles, clamped within 
+            the actuators constraints first (as RotaryActuator.actuate does).
+            Both backends give the same result up to rounding errors (see kernels.compare_backends).
+
+            angles: np.array -> shape = (B, n_joints, 3)
+            targets: np.array -> shape = (B, 3) or (B, len(joints_id), 3)
+            weights: np.array -> shape = (len(joints_id),) or (B, len(joints_id)), see vertices_distance
+            backend: Backend - defaults to self.backend
+            return (locations, bases, costs, gradient) -> shapes = (B, n_joints, 3), (B, n_joints, 3, 3), (B,), 
+                                                                   (B, n_joints, 3)
+        """
+        backend = self.backend if backend is None else check_available(backend=backend)
+        targets = np.asarray(targets, dtype=np.float64)
+        if targets.ndim == 2:
+            targets = targets[:, None, :]
+        targets = np.broadcast_to(targets, (len(angles), len(joints_id), 3))
+        if backend == Backend.NUMBA:
+            if self.__kernel_arrays is None:
+                self.__kernel_arrays = SkeletonArrays.from_skeleton(skeleton=self.skeleton)
+            weights = np.ones(shape=(len(joints_id),)) if weights is None else weights
+            _, locations, bases, costs, gradient = self.__kernel_arrays.evaluate(
+                angles=angles, targets=targets, weights=np.broadcast_to(weights, (len(angles), len(joints_id))), 
+                joints_id=joints_id)
+            return locations, bases, costs, gradient
+        angles = np.clip(angles, self.skeleton.angles_min, self.skeleton.angles_max)
+        locations, bases = self.skeleton.batch_forward_kinematics(angles=angles)
+        costs = self.batch_vertices_distance(pt_list=locations[:, joints_id], target=targets, weights=weights)
+        gradient = self.batch_cost_gradient(locations=locations, bases=bases, angles=angles, targets=targets, 
+                                            joints_id=joints_id, weights=weights)
+        return locations, bases, costs, gradient
+
+    def inverse_kinematics(self, target: np.array, joints_id: List[int], lr: float = 10, atol: float = 0.05,
+                           gradient: GradientMode = GradientMode.FINITE_DIFFERENCES, 
+                           warm_start: Optional[np.array] = None, 
+                           cache: Optional[SolutionCache] = None,
+                           optimizer: Optimizer = Optimizer.ADAM,
+                           max_iterations: int = 150,
+                           xtol: float = 1e-5,
+                           workspace: Optional[WorkspaceMap] = None,
+                           weights: Optional[np.array] = None) -> IKResult:
         """
             Data driven implementation of the Inverse kinematics
+
+            atol: float - ADAM: stop when no 1 deg probe changes the cost function more than atol
+                          LEVENBERG_MARQUARDT, MULTI_CHAIN, ANALYTIC: stop when the cost function (squared distance) 
+                          is below atol
+            gradient: GradientMode - how the derivatives of the cost function are estimated (ADAM only, 
+                                     LEVENBERG_MARQUARDT, MULTI_CHAIN and ANALYTIC always use the Jacobian)
+            warm_start: np.array -> shape = (n_joints, 3), actuators angles the solver starts from 
+                                    (defaults to the current skeleton state)
+            cache: SolutionCache - when warm_start is not provided the solver starts from the closest cached 
+                                   solution, converged solutions are added to the cache
+            optimizer: Optimizer - optimization algorithm
+            max_iterations: int - iterations budget
+            xtol: float - LEVENBERG_MARQUARDT, MULTI_CHAIN, ANALYTIC: stop when the largest angle update (rad) is below xtol
+            workspace: WorkspaceMap - map of joints_id, targets out of it are rejected without iterating,
+                                      when neither warm_start nor a cached solution are available 
+                                      the solver starts from the pose stored in the target voxel
+            weights: np.array -> shape = (len(joints_id),), weight of each joint in the cost function 
+                                 (see vertices_distance), use a (len(joints_id), 3) target to give each joint its own target
         """          
-        angle_dist = np.pi/180  # equivalent to 1 deg 
+        active = instrumentation.active()
+        if active is None:
+            return self.__inverse_kinematics(target=target, joints_id=joints_id, lr=lr, atol=atol, gradient=gradient,
+                                             warm_start=warm_start, cache=cache, optimizer=optimizer,
+                                             max_iterations=max_iterations, xtol=xtol, workspace=workspace, weights=weights,
+                                             trace=None)
+        trace = active.begin_solve(optimizer=optimizer.name if optimizer != Optimizer.ADAM 
+                                             else f"{optimizer.name}_{gradient.name}",
+                                   joints_id=joints_id, target=target)
+        start = time.perf_counter()
+        with active.phase(name="inverse_kinematics"):
+            result = self.__inverse_kinematics(target=target, joints_id=joints_id, lr=lr, atol=atol, gradient=gradient,
+                                               warm_start=warm_start, cache=cache, optimizer=optimizer,
+                                               max_iterations=max_iterations, xtol=xtol, workspace=workspace, weights=weights,
+                                               trace=trace)
+        trace.elapsed = time.perf_counter() - start
+        trace.reason = "unreachable" if not result.reachable else "converged" if result.converged \
+            else "stalled" if result.stalled else "max_iterations"
+        return result
+
+    def __inverse_kinematics(self, target: np.array, joints_id: List[int], lr: float, atol: float,
+                             gradient: GradientMode, warm_start: Optional[np.array], cache: Optional[SolutionCache],
+                             optimizer: Optimizer, max_iterations: int, xtol: float, 
+                             workspace: Optional[WorkspaceMap], weights: Optional[np.array],
+                             trace: Optional[SolveTrace]) -> IKResult:
+        """
+            Inverse kinematics iterations, trace records the error and the step size of each iteration
+        """
         count = 0
-        max_count = 150
-        self.momentum: List[float] = [[0, 0, 0] for _ in self.skeleton.joints]
-        self.s: List[float] = [[0, 0, 0] for _ in self.skeleton.joints]
-
-        while count < max_count:
-            stop_flag: bool = True
-            for j in self.skeleton.joints:                     
-                for i in range(3):
-                    shadow = self.skeleton.get_shadow()                             
-                    locations = np.array([shadow.joints[j].location for j in joints_id])          
-                    error = self.vertices_distance(pt_list=locations, target=target)
+        step = self.__reset_optimizer(optimizer=optimizer, gradient=gradient)
+        if workspace is not None:
+            if workspace.joints_id != list(joints_id):
+                raise ValueError(f"workspace map built for joints {workspace.joints_id}, not {list(joints_id)}")
+            if not workspace.is_reachable(target=target):
+                result = IKResult(angles=self.skeleton.get_angles(), converged=False, 
+                                  error=self.vertices_distance(pt_list=self.skeleton.get_locations(joints_id=joints_id), 
+                                                               target=target, weights=weights),
+                                  iterations=0, reachable=False)
+                for observer in self.observers:
+                    observer.on_solve_end(robot=self, target=target, result=result)
+                return result
+        looked_up = cache is not None and warm_start is None
+        cached = None
+        if looked_up:
+            cached = warm_start = cache.lookup(target=target, joints_id=joints_id)
+        if warm_start is None and workspace is not None:
+            warm_start = workspace.seed(target=target)
+        if warm_start is not None:
+            self.skeleton.set_angles(angles=warm_start)
 
-                    self.delta_commands[j.id, i] = angle_dist
-                    self.apply_kinematics(skeleton=shadow, joint_id=j.id)              
-                    locations = np.array([shadow.joints[j].location for j in joints_id])                    
-                    new_error = self.vertices_distance(pt_list=locations, target=target)
-
-                    # early stopping criteria
-                    if abs(new_error - error) > atol:
-                        stop_flag = False                            
-      
-                    # Adam Optimizer
-                    self.momentum[j.id][i] = self.beta_1*self.momentum[j.id][i] - (1-self.beta_1)*(new_error-error)/angle_dist
-                    self.s[j.id][i] = (self.beta_2*self.s[j.id][i] + (1-self.beta_2)*((new_error-error)/angle_dist)**2) 
-                    s = self.s[j.id][i] / (1-self.beta_2**(count+1))
-                    m =  self.momentum[j.id][i] / (1-self.beta_1**(count+1))
-                    self.delta_commands[j.id, i] = lr*m/(math.sqrt(s)+self.epsilon)
-                   
-                    # GD Optimizer
-                    #self.delta_commands[j.id, i] = -lr*(new_error-error)/angle_dist
-                    self.apply_kinematics(skeleton=self.skeleton, joint_id=j.id) 
+        # closed form first, the iterations only refine the poses it can not reach
+        stop_flag = optimizer == Optimizer.ANALYTIC and \
+            self.__closed_form(target=target, joints_id=joints_id, atol=atol, weights=weights)
+        while not stop_flag and count < max_iterations:
+            if trace is not None:
+                previous_angles = self.skeleton.get_angles()
+            stop_flag = step(target=target, joints_id=joints_id, weights=weights, lr=lr, atol=atol, xtol=xtol, count=count)
+            instrumentation.count("iterations")
+            if trace is not None:
+                trace.errors.append(float(self.batch_vertices_distance(pt_list=self.skeleton.get_locations(joints_id=joints_id),
+                                                                       target=target, weights=weights)))
+                trace.step_sizes.append(float(np.max(np.abs(self.skeleton.angles - previous_angles))))
             if stop_flag:                
                 break            
             count += 1                    
-            self.refresh_plot(target=target)
-
-
-    # move view part into skeleton or into an external class 
-    def refresh_plot(self, target: np.array) -> None:
-        """
-            Plot iteration
-        """
-        self.plot.clear()                 
-        self.plot.set_xlim(-20, 20)
-        self.plot.set_ylim(-20, 20)
-        self.plot.set_zlim(0, 20)
-        self.plot.set_xlabel('X')
-        self.plot.set_ylabel('Y')
-        self.plot.set_zlabel('Z')       
-        self.plot.plot(target[0], target[1], target[2], marker='*')
-        self.plot_config(vertex_id=0, color='r')          
-        plt.pause(0.0001)
-             
-    def plot_config(self, vertex_id: np.array, color: str = 'b') -> None:           
-        self.skeleton.visited[vertex_id] = True
+            with instrumentation.phase("observers"):
+                for observer in self.observers:
+                    observer.on_iteration(robot=self, target=target, iteration=count)
         
-        # plot joint basis
-        line_xs = np.linspace(self.skeleton.joints[vertex_id].location[0], self.skeleton.joints[vertex_id].location[0]+self.skeleton.joints[vertex_id].basis[0, 0], 100)    
-        line_ys = np.linspace(self.skeleton.joints[vertex_id].location[1], self.skeleton.joints[vertex_id].location[1]+self.skeleton.joints[vertex_id].basis[0, 1], 100)    
-        line_zs = np.linspace(self.skeleton.joints[vertex_id].location[2], self.skeleton.joints[vertex_id].location[2]+self.skeleton.joints[vertex_id].basis[0, 2], 100)  
-        self.plot.plot(line_xs, line_ys, line_zs, color='b')      
-        line_xs = np.linspace(self.skeleton.joints[vertex_id].location[0], self.skeleton.joints[vertex_id].location[0]+self.skeleton.joints[vertex_id].basis[1, 0], 100)    
-        line_ys = np.linspace(self.skeleton.joints[vertex_id].location[1], self.skeleton.joints[vertex_id].location[1]+self.skeleton.joints[vertex_id].basis[1, 1], 100)    
-        line_zs = np.linspace(self.skeleton.joints[vertex_id].location[2], self.skeleton.joints[vertex_id].location[2]+self.skeleton.joints[vertex_id].basis[1, 2], 100)  
-        self.plot.plot(line_xs, line_ys, line_zs, color='g')      
-        line_xs = np.linspace(self.skeleton.joints[vertex_id].location[0], self.skeleton.joints[vertex_id].location[0]+self.skeleton.joints[vertex_id].basis[2, 0], 100)    
-        line_ys = np.linspace(self.skeleton.joints[vertex_id].location[1], self.skeleton.joints[vertex_id].location[1]+self.skeleton.joints[vertex_id].basis[2, 1], 100)    
-        line_zs = np.linspace(self.skeleton.joints[vertex_id].location[2], self.skeleton.joints[vertex_id].location[2]+self.skeleton.joints[vertex_id].basis[2, 2], 100)  
-        self.plot.plot(line_xs, line_ys, line_zs, color='r')   
-
-        # Plot skeleton bones
-        for v in self.skeleton.edges[vertex_id]: 
-            if not self.skeleton.visited[v]:         
-                line_xs = np.linspace(self.skeleton.joints[vertex_id].location[0], self.skeleton.joints[v].location[0], 100)    
-                line_ys = np.linspace(self.skeleton.joints[vertex_id].location[1], self.skeleton.joints[v].location[1], 100)    
-                line_zs = np.linspace(self.skeleton.joints[vertex_id].location[2], self.skeleton.joints[v].location[2], 100)  
-                self.plot.plot(line_xs, line_ys, line_zs, zdir='z', color=color)                       
-                self.plot_config(vertex_id=v)    
-        self.skeleton.refresh_visited_state()
\ No newline at end of file
+        result = IKResult(angles=self.skeleton.get_angles(), converged=stop_flag and not self.stalled, 
+                          error=self.vertices_distance(pt_list=self.skeleton.get_locations(joints_id=joints_id), 
+                                                       target=target, weights=weights),
+                          iterations=count, stalled=self.stalled)
+        if cache is not None:
+            if looked_up:
+                # workspace seeds do not count as cache hits
+                cache.record_iterations(iterations=count, seeded=cached is not None)
+            # stalled or loosely converged poses would seed the following solves far from their targets
+            if result.converged and result.error <= atol:
+                cache.store(target=target, joints_id=joints_id, angles=result.angles, error=result.error)
+        for observer in self.observers:
+            observer.on_solve_end(robot=self, target=target, result=result)
+        return result
+
+    def __closed_form(self, target: np.array, joints_id: List[int], atol: float, 
+                      weights: Optional[np.array] = None) -> bool:
+        """
+            Move the skeleton to the best closed form pose reaching target, ties go to the smallest move.
+            The skeleton stays still when its current pose is closer to target than the clipped poses.
+            return bool - the pose reaches target within atol, False as well when joints_id has no closed form
+        """
+        key = tuple(joints_id)
+        if key not in self.__closed_forms:
+            self.__closed_forms[key] = PlanarChain.detect(skeleton=self.skeleton, joints_id=joints_id)
+        chain = self.__closed_forms[key]
+        if chain is None:
+            return False
+        with instrumentation.phase("closed_form"):
+            angles = self.skeleton.get_angles()
+            candidates = np.concatenate((chain.candidates(target=np.asarray(target, dtype=np.float64).reshape(3), 
+                                                          angles=angles), angles[None]))
+            locations, _ = self.skeleton.batch_forward_kinematics(angles=candidates)
+            errors = self.batch_vertices_distance(pt_list=locations[:, joints_id], target=np.reshape(target, 3), 
+                                                  weights=weights)
+            moves = np.max(np.abs(candidates - angles), axis=(1, 2))
+            best = np.lexsort((moves, np.round(errors, 12)))[0]
+            self.skeleton.set_angles(angles=candidates[best])
+        return bool(errors[best] <= atol)
+
+    def __reset_optimizer(self, optimizer: Optimizer, gradient: GradientMode) -> Callable[..., bool]:
+        """
+            Clear the optimizer state and select the iteration of the optimizer
+        """
+        self.momentum = np.zeros(shape=(len(self.skeleton.joints), 3))
+        self.s = np.zeros(shape=(len(self.skeleton.joints), 3))
+        self.damping = 0.0
+        self.stalled = False
+        if optimizer in (Optimizer.LEVENBERG_MARQUARDT, Optimizer.ANALYTIC):
+            return self.__levenberg_marquardt_step
+        if optimizer == Optimizer.MULTI_CHAIN:
+            return self.__multi_chain_step
+        return self.__jacobian_step if gradient == GradientMode.JACOBIAN else self.__finite_differences_step
+
+    def stream_inverse_kinematics(self, targets: Iterable[np.array], joints_id: List[int], budget: float = 0.002,
+                                  max_iterations_per_tick: int = 20, lr: float = .03, atol: float = 0.05,
+                                  gradient: GradientMode = GradientMode.JACOBIAN,
+                                  optimizer: Optimizer = Optimizer.ADAM, xtol: float = 1e-5,
+                                  weights: Optional[np.array] = None) -> Iterator[StreamTick]:
+        """
+            Real time Inverse kinematics: one answer for each target of the stream.
+            Each tick runs solver iterations until convergence, max_iterations_per_tick or the time budget,
+            joints angles and optimizer state are carried from a tick to the following one.
+
+            targets: Iterable[np.array] - stream of targets, shape = (3,) or (len(joints_id), 3)
+            budget: float - seconds available for each tick (at least one iteration is always run)
+            lr, atol, gradient, optimizer, xtol, weights: see inverse_kinematics
+        """
+        step = self.__reset_optimizer(optimizer=optimizer, gradient=gradient)
+        count, missed = 0, 0
+        previous = None
+        for target in targets:
+            tick, count = self.__stream_tick(target=target, joints_id=joints_id, step=step, budget=budget,
+                                             max_iterations=max_iterations_per_tick, lr=lr, atol=atol, xtol=xtol,
+                                             weights=weights, count=count, missed=missed, previous=previous)
+            missed, previous = tick.missed_deadlines, tick.target
+            yield tick
+
+    async def astream_inverse_kinematics(self, queue: asyncio.Queue, joints_id: List[int], budget: float = 0.002,
+                                         max_iterations_per_tick: int = 20, lr: float = .03, atol: float = 0.05,
+                                         gradient: GradientMode = GradientMode.JACOBIAN,
+                                         optimizer: Optimizer = Optimizer.ADAM,
+                                         xtol: float = 1e-5,
+                                         weights: Optional[np.array] = None) -> AsyncIterator[StreamTick]:
+        """
+            Asyncio version of stream_inverse_kinematics, targets are read from queue until None is received.
+            Ticks run on the event loop thread, their duration is bounded by budget.
+        """
+        step = self.__reset_optimizer(optimizer=optimizer, gradient=gradient)
+        count, missed = 0, 0
+        previous = None
+        while True:
+            target = await queue.get()
+            if target is None:
+                return
+            tick, count = self.__stream_tick(target=target, joints_id=joints_id, step=step, budget=budget,
+                                             max_iterations=max_iterations_per_tick, lr=lr, atol=atol, xtol=xtol,
+                                             weights=weights, count=count, missed=missed, previous=previous)
+            missed, previous = tick.missed_deadlines, tick.target
+            yield tick
+
+    def __stream_tick(self, target: np.array, joints_id: List[int], step: Callable[..., bool], budget: float,
+                      max_iterations: int, lr: float, atol: float, xtol: float, weights: Optional[np.array],
+                      count: int, missed: int, previous: Optional[np.array]) -> Tuple[StreamTick, int]:
+        """
+            Iterate on target within the tick budget, an iteration is started only if it is expected
+            to end before the deadline (its duration is estimated from the previous one).
+            The damping restarts from its initial value when the target changes and when an iteration stalls,
+            a stall ends the tick only if it occurs right after such a restart.
+
+            count: int - iterations run since the stream started (Adam bias correction)
+            previous: np.array - target of the previous tick, None for the first one
+            return (tick, count)
+        """
+        start = time.perf_counter()
+        target = np.asarray(target, dtype=np.float64)
+        if previous is None or not np.array_equal(target, previous):
+            self.damping = 0.0
+        converged = False
+        iterations = 0
+        last_duration = 0.0
+        while iterations < max_iterations:
+            now = time.perf_counter()
+            if iterations > 0 and now - start + last_duration > budget:
+                break
+            restarted = self.damping == 0.0
+            converged = step(target=target, joints_id=joints_id, weights=weights, lr=lr, atol=atol, xtol=xtol, 
+                             count=count)
+            last_duration = time.perf_counter() - now
+            iterations += 1
+            count += 1
+            for observer in self.observers:
+                observer.on_iteration(robot=self, target=target, iteration=count)
+            if converged:
+                converged = not self.stalled
+                if converged:
+                    break
+                # a damping grown by rejected steps stalls far from the minimum, retry from a fresh one
+                self.damping = 0.0
+                if restarted:
+                    break
+        error = self.vertices_distance(pt_list=self.skeleton.get_locations(joints_id=joints_id), target=target, 
+                                       weights=weights)
+        latency = time.perf_counter() - start
+        deadline_missed = latency > budget
+        return StreamTick(target=target, angles=self.skeleton.get_angles(), error=error, converged=converged,
+                          iterations=iterations, latency=latency, deadline_missed=deadline_missed,
+                          missed_deadlines=missed + int(deadline_missed)), count
+
+    def __finite_differences_step(self, target: np.array, joints_id: List[int], weights: Optional[np.array], 
+                                  lr: float, atol: float, xtol: float, count: int) -> bool:
+        """
+            Adam iteration estimating the derivatives by probing each actuator on a shadow skeleton
+        """
+        stop_flag: bool = True
+        for j in self.skeleton.joints:                     
+            for i in range(3):
+                # axes without actuator can not move, their derivative is 0
+                if not self.skeleton.actuated_axes[j.id, i]:
+                    continue
+                with instrumentation.phase("shadow"):
+                    shadow = self.skeleton.get_shadow()                             
+                with instrumentation.phase("cost"):
+                    locations = shadow.get_locations(joints_id=joints_id)          
+                    error = self.vertices_distance(pt_list=locations, target=target, weights=weights)
+
+                self.delta_commands[j.id, i] = self.ANGLE_DIST
+                with instrumentation.phase("actuation"):
+                    self.apply_kinematics(skeleton=shadow, joint_id=j.id)              
+                with instrumentation.phase("cost"):
+                    locations = shadow.get_locations(joints_id=joints_id)                    
+                    new_error = self.vertices_distance(pt_list=locations, target=target, weights=weights)
+
+                # early stopping criteria
+                if abs(new_error - error) > atol:
+                    stop_flag = False                            
+  
+                # Adam Optimizer
+                self.momentum[j.id][i] = self.beta_1*self.momentum[j.id][i] - (1-self.beta_1)*(new_error-error)/self.ANGLE_DIST
+                self.s[j.id][i] = (self.beta_2*self.s[j.id][i] + (1-self.beta_2)*((new_error-error)/self.ANGLE_DIST)**2) 
+                s = self.s[j.id][i] / (1-self.beta_2**(count+1))
+                m =  self.momentum[j.id][i] / (1-self.beta_1**(count+1))
+                self.delta_commands[j.id, i] = lr*m/(math.sqrt(s)+self.epsilon)
+               
+                # GD Optimizer
+                #self.delta_commands[j.id, i] = -lr*(new_error-error)/self.ANGLE_DIST
+                with instrumentation.phase("actuation"):
+                    self.apply_kinematics(skeleton=self.skeleton, joint_id=j.id) 
+        return stop_flag
+
+    def __jacobian_step(self, target: np.array, joints_id: List[int], weights: Optional[np.array], 
+                        lr: float, atol: float, xtol: float, count: int) -> bool:
+        """
+            Adam iteration using the analytic gradient of the cost function
+        """
+        with instrumentation.phase("gradient"):
+            grad = self.cost_gradient(target=target, joints_id=joints_id, weights=weights)
+        # early stopping criteria, same threshold used for the finite differences probe
+        stop_flag = bool(np.all(np.abs(grad)*self.ANGLE_DIST <= atol))
+
+        # Adam Optimizer
+        self.momentum = self.beta_1*self.momentum - (1-self.beta_1)*grad
+        self.s = self.beta_2*self.s + (1-self.beta_2)*grad**2
+        s = self.s / (1-self.beta_2**(count+1))
+        m = self.momentum / (1-self.beta_1**(count+1))
+        with instrumentation.phase("actuation"):
+            for j in self.skeleton.joints:
+                self.delta_commands[j.id, :3] = lr*m[j.id]/(np.sqrt(s[j.id])+self.epsilon)
+                self.apply_kinematics(skeleton=self.skeleton, joint_id=j.id)
+        return stop_flag
+
+    def __levenberg_marquardt_step(self, target: np.array, joints_id: List[int], weights: Optional[np.array], 
+                                   lr: float, atol: float, xtol: float, count: int) -> bool:
+        """
+            Damped least squares iteration solving the normal equations of all the actuators at once
+        """
+        return self.__damped_least_squares_step(target=target, joints_id=joints_id, weights=weights, atol=atol, 
+                                                xtol=xtol, solve=self.__dense_solve)
+
+    def __multi_chain_step(self, target: np.array, joints_id: List[int], weights: Optional[np.array], 
+                           lr: float, atol: float, xtol: float, count: int) -> bool:
+        """
+            Damped least squares iteration where the chains below the shared joints are solved as independent 
+            stacked problems, coordinated with the shared joints through the Schur complement
+        """
+        return self.__damped_least_squares_step(target=target, joints_id=joints_id, weights=weights, atol=atol, 
+                                                xtol=xtol, solve=self.__chains_solve)
+
+    def __damped_least_squares_step(self, target: np.array, joints_id: List[int], weights: Optional[np.array], 
+                                    atol: float, xtol: float, solve: Callable[..., np.array]) -> bool:
+        """
+            Damped least squares iteration, the step is accepted only if it reduces the cost function 
+            and the damping is adapted accordingly. Actuators lying on a constraint and pushed outward are locked.
+            return bool - stop iterating, the cost function is below atol unless self.stalled is set
+        """
+        sqrt_weights = np.ones(shape=(len(joints_id), 1)) if weights is None else np.sqrt(weights)[:, None]
+        with instrumentation.phase("cost"):
+            residuals = ((self.skeleton.get_locations(joints_id=joints_id) - target)*sqrt_weights).ravel()
+            cost = residuals @ residuals
+        instrumentation.count("cost_evaluations")
+        self.stalled = False
+        if cost <= atol:
+            return True
+
+        angles = self.skeleton.get_angles()
+        with instrumentation.phase("jacobian"):
+            jac = (self.skeleton.jacobian(joints_id=joints_id)*sqrt_weights[:, :, None, None]).reshape(len(residuals), -1)
+        gradient = (jac.T @ residuals).reshape(-1, 3)
+        locked = ((angles >= self.skeleton.angles_max) & (gradient < 0)) | \
+                 ((angles <= self.skeleton.angles_min) & (gradient > 0))
+        free = (self.skeleton.actuated_axes & ~locked).ravel()
+        if not free.any():
+            self.stalled = True
+            return True
+        jac = jac[:, free]
+        if self.damping == 0.0:
+            # relative to the largest diagonal entry of the Gauss-Newton hessian
+            self.damping = 1e-3*max(np.max(np.sum(jac**2, axis=0)), 1e-9)
+
+        with instrumentation.phase("linear_solve"):
+            step = solve(jac=jac, residuals=residuals, free=free, joints_id=joints_id)
+        new_angles = angles.copy()
+        new_angles.reshape(-1)[free] += step
+        clipped = np.clip(new_angles, self.skeleton.angles_min, self.skeleton.angles_max)
+        instrumentation.count("clamps", int(np.count_nonzero(clipped != new_angles)))
+        new_angles = clipped
+        with instrumentation.phase("cost"):
+            new_locations, _ = self.skeleton.batch_forward_kinematics(angles=new_angles[None])
+            new_residuals = ((new_locations[0, joints_id] - target)*sqrt_weights).ravel()
+        instrumentation.count("cost_evaluations")
+
+        if new_residuals @ new_residuals < cost:
+            self.skeleton.set_angles(angles=new_angles)
+            self.damping = max(self.damping/3, 1e-12)
+        else:
+            self.damping = min(self.damping*5, self.MAX_DAMPING)
+        # the update vanished (solution, local minimum or damping grown by rejected steps) above atol
+        self.stalled = bool(np.max(np.abs(new_angles - angles)) < xtol)
+        return self.stalled
+
+    def __dense_solve(self, jac: np.array, residuals: np.array, free: np.array, joints_id: List[int]) -> np.array:
+        """
+            Damped normal equations step for the free actuators
+
+            jac: np.array -> shape = (3*len(joints_id), n_free) 
+        """
+        hessian = jac.T @ jac
+        return np.linalg.solve(hessian + self.damping*np.eye(len(hessian)), -jac.T @ residuals)
+
+    def __chains_solve(self, jac: np.array, residuals: np.array, free: np.array, joints_id: List[int]) -> np.array:
+        """
+            Same step of __dense_solve exploiting the structure of the Jacobian: the actuators of the private chain
+            of joints_id[k] only move joints_id[k], their block of the normal equations is diagonal.
+            The chains blocks are padded to the longest chain and solved at once, the shared actuators
+            solve the (small) Schur complement system.
+
+            jac: np.array -> shape = (3*len(joints_id), n_free) 
+        """
+        n_chains, n_free = len(joints_id), jac.shape[1]
+        groups = np.repeat(self.skeleton.chains_groups(joints_id=joints_id), 3)[free]
+        shared = np.flatnonzero(groups == -1)
+        # columns of each chain, padded with a zero column (index n_free)
+        columns = [np.flatnonzero(groups == k) for k in range(n_chains)]
+        width = max([len(c) for c in columns], default=0)
+        padded = np.full(shape=(n_chains, width), fill_value=n_free)
+        for k, c in enumerate(columns):
+            padded[k, :len(c)] = c
+
+        jac = jac.reshape(n_chains, 3, n_free)
+        residuals = residuals.reshape(n_chains, 3)
+        jac_shared = jac[:, :, shared]                                                                   # (K, 3, S)
+        jac_chains = np.take_along_axis(np.concatenate((jac, np.zeros(shape=(n_chains, 3, 1))), axis=2), 
+                                        padded[:, None, :], axis=2)                                      # (K, 3, W)
+        chains_blocks = np.swapaxes(jac_chains, 1, 2) @ jac_chains + self.damping*np.eye(width)         # (K, W, W)
+        coupling = np.swapaxes(jac_shared, 1, 2) @ jac_chains                                            # (K, S, W)
+        chains_grad = (np.swapaxes(jac_chains, 1, 2) @ residuals[..., None])[..., 0]                   # (K, W)
+        shared_grad = jac_shared.reshape(3*n_chains, len(shared)).T @ residuals.ravel()                         # (S,)
+
+        # eliminate the chains, then back substitute the shared step
+        inv_coupling_t = np.linalg.solve(chains_blocks, np.swapaxes(coupling, 1, 2))                    # (K, W, S)
+        inv_grad = np.linalg.solve(chains_blocks, chains_grad[..., None])[..., 0]                      # (K, W)
+        flat_shared = jac_shared.reshape(3*n_chains, len(shared))
+        schur = flat_shared.T @ flat_shared + self.damping*np.eye(len(shared)) \
+                - np.sum(coupling @ inv_coupling_t, axis=0)
+        shared_step = np.linalg.solve(schur, -shared_grad + np.sum(coupling @ inv_grad[..., None], axis=0)[:, 0]) \
+                      if len(shared) > 0 else np.zeros(shape=(0,))
+        chains_step = -inv_grad - inv_coupling_t @ shared_step
+
+        step = np.zeros(shape=(n_free,))
+        step[shared] = shared_step
+        valid = padded < n_free
+        step[padded[valid]] = chains_step[valid]
+        return step
+
+    def solve_trajectory(self, waypoints: np.array, joints_id: List[int], max_step: Optional[float] = np.pi/36,
+                         optimizer: Optimizer = Optimizer.LEVENBERG_MARQUARDT, 
+                         gradient: GradientMode = GradientMode.JACOBIAN, lr: float = .03, atol: float = 0.05, 
+                         max_iterations: int = 50, xtol: float = 1e-5, weights: Optional[np.array] = None, 
+                         initial_angles: Optional[np.array] = None) -> TrajectoryResult:
+        """
+            Solve a path of targets in order, each waypoint starts from the solution of the previous one.
+            The change of each actuator between consecutive waypoints is limited to max_step, the whole
+            trajectory is then validated with batched forward kinematics. The skeleton is left at the last pose.
+
+            waypoints: np.array -> shape = (T, 3) or (T, len(joints_id), 3)
+            max_step: float - largest change (rad) of an actuator between consecutive waypoints, None for no limit
+            initial_angles: np.array -> shape = (n_joints, 3), pose before the first waypoint 
+                                        (defaults to the current angles)
+            optimizer, gradient, lr, atol, max_iterations, xtol, weights: see inverse_kinematics
+        """
+        start = time.perf_counter()
+        waypoints = np.asarray(waypoints, dtype=np.float64)
+        angles = np.empty(shape=(len(waypoints), len(self.skeleton.joints), 3))
+        converged = np.zeros(shape=(len(waypoints),), dtype=bool)
+        iterations = np.zeros(shape=(len(waypoints),), dtype=int)
+        previous = self.skeleton.get_angles() if initial_angles is None else np.asarray(initial_angles, dtype=np.float64)
+        for t, waypoint in enumerate(waypoints):
+            result = self.inverse_kinematics(target=waypoint, joints_id=joints_id, lr=lr, atol=atol, gradient=gradient,
+                                             warm_start=previous, optimizer=optimizer, max_iterations=max_iterations,
+                                             xtol=xtol, weights=weights)
+            angles[t] = result.angles
+            converged[t] = result.converged
+            iterations[t] = result.iterations
+            if max_step is not None and np.max(np.abs(result.angles - previous)) > max_step:
+                angles[t] = previous + np.clip(result.angles - previous, -max_step, max_step)
+                converged[t] = False
+                self.skeleton.set_angles(angles=angles[t])
+            previous = angles[t]
+
+        # one forward kinematics pass over the whole trajectory
+        locations, _ = self.skeleton.batch_forward_kinematics(angles=angles)
+        targets = waypoints if waypoints.ndim == 3 else waypoints[:, None, :]
+        errors = self.batch_vertices_distance(pt_list=locations[:, joints_id], target=targets, weights=weights)
+        return TrajectoryResult(angles=self.skeleton.pack_angles(angles=angles), errors=errors, converged=converged,
+                                iterations=iterations, elapsed=time.perf_counter() - start)
+
+    def batch_inverse_kinematics(self, targets: np.array, joints_id: List[int], lr: float = .03, atol: float = 0.05, 
+                                 max_iterations: int = 150, initial_angles: Optional[np.array] = None,
+                                 weights: Optional[np.array] = None) -> BatchIKResult:
+        """
+            Solve many independent Inverse kinematics problems at once.
+            Every problem starts from the same actuators angles and is advanced with the Jacobian driven 
+            Adam optimizer on stacked skeleton states, the robot skeleton is left untouched.
+
+            targets: np.array -> shape = (B, 3) one target shared by joints_id 
+                                 or (B, len(joints_id), 3) one target for each joint in joints_id
+            initial_angles: np.array -> shape = (n_joints, 3) or (B, n_joints, 3), defaults to the current angles
+            weights: np.array -> shape = (len(joints_id),), see inverse_kinematics
+        """
+        start = time.perf_counter()
+        targets = np.asarray(targets, dtype=np.float64)
+        if targets.ndim == 2:
+            targets = targets[:, None, :]
+        n_batch = len(targets)
+        if initial_angles is None:
+            initial_angles = self.skeleton.get_angles()
+        angles = np.broadcast_to(initial_angles, (n_batch, len(self.skeleton.joints), 3)).copy()
+        momentum = np.zeros_like(angles)
+        s = np.zeros_like(angles)
+        converged = np.zeros(shape=(n_batch,), dtype=bool)
+        iterations = np.zeros(shape=(n_batch,), dtype=int)
+
+        for count in range(max_iterations):
+            active = np.flatnonzero(~converged)
+            if len(active) == 0:
+                break
+            grad = self.batch_evaluate(angles=angles[active], targets=targets[active], joints_id=joints_id,
+                                       weights=weights)[3]
+            # early stopping criteria, same threshold used by inverse_kinematics
+            converged[active] = np.all(np.abs(grad)*self.ANGLE_DIST <= atol, axis=(1, 2))
+
+            # Adam Optimizer
+            momentum[active] = self.beta_1*momentum[active] - (1-self.beta_1)*grad
+            s[active] = self.beta_2*s[active] + (1-self.beta_2)*grad**2
+            m_hat = momentum[active] / (1-self.beta_1**(count+1))
+            s_hat = s[active] / (1-self.beta_2**(count+1))
+            step = lr*m_hat/(np.sqrt(s_hat)+self.epsilon)
+            step[converged[active]] = 0
+            angles[active] = np.clip(angles[active] + step, self.skeleton.angles_min, self.skeleton.angles_max)
+            iterations[active] += ~converged[active]
+
+        locations, _ = self.skeleton.batch_forward_kinematics(angles=angles)
+        errors = self.batch_vertices_distance(pt_list=locations[:, joints_id], target=targets, weights=weights)
+        return BatchIKResult(angles=angles, converged=converged, errors=errors, iterations=iterations,
+                             elapsed=time.perf_counter() - start)
@@ -1,10 +1,11 @@
 from __future__ import annotations
 import numpy as np
 import copy
-from typing import Dict, List, Any
-import matplotlib.pyplot as plt
+from typing import Dict, List, Any, Tuple, Optional
 import utils 
+import instrumentation
 from joints import Joint
+from topology import Topology
 
 
 class Skeleton:    
@@ -19,32 +20,120 @@ class Skeleton:
         
         super(Skeleton, self).__init__()
         self.joints: List[Joint] = joints
+        # joints state, each joint location and basis is a view onto these arrays (see locations and bases)
+        self._locations: np.array = np.zeros(shape=(len(self.joints), 3))
+        self._bases: np.array = np.tile(np.eye(3), (len(self.joints), 1, 1))
         self.edges: List[List[int]] = edges
         self.edges_t: List[List[int]] = []                
         self.transpose_edges()        
-        self.visited: List[bool] = [False]*len(self.joints)          
-        # child related to each joint
-        self.childs_collection: List[List[int]] = []                
+        # parents, preorder and subtree ranges
+        self.topology: Topology = Topology(edges=self.edges)
+        # actuated_axes[i, k] is True if joint i has an actuator rotating around its basis axis k
+        self.actuated_axes: np.array = np.zeros(shape=(len(self.joints), 3), dtype=bool)
         
         self.__initialize_joints(jnts_strt_loc=joints_loc, jnts_strt_ngls=joints_angles)
                 
+    @classmethod
+    def from_arrays(cls, joints: List[Joint], edges: List[List[int]], topology: Topology,
+                    rest_locations: np.array, rest_bases: np.array) -> Skeleton:
+        """
+            Build a skeleton from a precomputed topology and rest state (see compiled_model.py),
+            no traversal nor basis alignment is run.
+
+            topology: Topology - index of edges
+            rest_locations: np.array -> shape = (n_joints, 3), kept as rest state without copy
+            rest_bases: np.array -> shape = (n_joints, 3, 3), kept as rest state without copy
+        """
+        skeleton = cls.__new__(cls)
+        skeleton.joints = joints
+        skeleton._locations = np.array(rest_locations, dtype=np.float64)
+        skeleton._bases = np.array(rest_bases, dtype=np.float64)
+        skeleton.edges = edges
+        skeleton.transpose_edges()
+        skeleton.topology = topology
+        skeleton.actuated_axes = np.zeros(shape=(len(joints), 3), dtype=bool)
+        skeleton.__initialize_topology()
+        skeleton.__initialize_rest_state(rest_locations=rest_locations, rest_bases=rest_bases)
+        return skeleton
+
     def __initialize_joints(self, jnts_strt_loc: List[np.array], 
                                 jnts_strt_ngls: List[np.array]):   
         """
             Initialize variables related to skeleton joints
         """     
-        for i in range(len(self.joints)):
-            # append child related to selected joint
-            self.childs_collection.append(self.joint_dfs_traversing(i))
-            self.refresh_visited_state()
+        self.__initialize_topology()
 
         # init joints locations 
-        for j in self.joints:            
-            j.location = jnts_strt_loc[j.id]
+        self._locations[:] = jnts_strt_loc
 
         # init joints orientation 
         self.__set_joints_basis_alignement(joints_angles=jnts_strt_ngls) 
+        self.__initialize_rest_state()
+
+    def __initialize_topology(self) -> None:
+        """
+            Index arrays derived from the topology
+        """
+        for j in self.joints:
+            for act in j.actuators:
+                self.actuated_axes[j.id, act.axis] = True
+        # (joint, axis) of each actuator, columns of the compact angles layout (see pack_angles)
+        self.actuators_index: np.array = np.argwhere(self.actuated_axes)
+        # parent of each joint (-1 for roots) and joints sorted such that parents come before their childs
+        self.parents: np.array = self.topology.parents
+        self.order: np.array = self.topology.order
+        # joints grouped by depth, a level only depends on the previous one
+        self.levels: List[np.array] = self.topology.levels
+        self.levels_parents: List[np.array] = [self.parents[level] for level in self.levels]
+        # actuators grouped by their position inside the joint, (joints, axes) of the 1st actuators, of the 2nd, ...
+        self.actuators_ranks: List[Tuple[np.array, np.array]] = []
+        for rank in range(max([len(j.actuators) for j in self.joints], default=0)):
+            ranked = [(j.id, j.actuators[rank].axis) for j in self.joints if len(j.actuators) > rank]
+            self.actuators_ranks.append((np.array([r[0] for r in ranked]), np.array([r[1] for r in ranked])))
+        self.__bind_joints()
+
+    def __initialize_rest_state(self, rest_locations: Optional[np.array] = None, 
+                                rest_bases: Optional[np.array] = None) -> None:
+        """
+            Rest state and actuators related arrays, the joints are expected in their rest pose.
+
+            rest_locations, rest_bases: np.array - read only arrays shared as rest state (e.g. memory mapped),
+                                                   copies of the joints state when not provided
+        """
+        # rest state, forward kinematics express every pose as a rotation of it
+        self.rest_locations: np.array = self._locations.copy() if rest_locations is None else rest_locations
+        self.rest_bases: np.array = self._bases.copy() if rest_bases is None else rest_bases
+        # location of each joint in the rest system of its parent
+        self.levels_offsets: List[np.array] = [self.rest_locations[level] - self.rest_locations[parents] 
+                                               for level, parents in zip(self.levels, self.levels_parents)]
+        self.__chains: Dict[Tuple[int, ...], np.array] = {}
+        self.__groups: Dict[Tuple[int, ...], np.array] = {}
+        self.angles: np.array = np.zeros(shape=(len(self.joints), 3))
+        for j in self.joints:
+            for act in j.actuators:
+                self.angles[j.id, act.axis] = act.angle
+        self.rest_angles: np.array = self.angles.copy()
+        # rotation of each joint system due to its own actuators (local) and to all the actuators 
+        # from the root to the joint (world), both with respect to the rest state.
+        # world rotations, locations and bases of dirty joints are recomposed only when they are read.
+        self.local_rotations: np.array = np.tile(np.eye(3), (len(self.joints), 1, 1))
+        self.world_rotations: np.array = np.tile(np.eye(3), (len(self.joints), 1, 1))
+        self.dirty: np.array = np.zeros(shape=(len(self.joints),), dtype=bool)
+        # actuators constraints, same layout of get_angles (not actuated axes are locked to 0)
+        self.angles_min: np.array = np.zeros(shape=(len(self.joints), 3))
+        self.angles_max: np.array = np.zeros(shape=(len(self.joints), 3))
+        for j in self.joints:
+            for act in j.actuators:
+                self.angles_min[j.id, act.axis] = act.constraints['min']
+                self.angles_max[j.id, act.axis] = act.constraints['max']
     
+    def __bind_joints(self) -> None:
+        """
+            Bind joints location and basis to the skeleton state arrays
+        """
+        for j in self.joints:
+            j.bind_state(location=self._locations[j.id], basis=self._bases[j.id], refresh=self.update)
+
     def transpose_edges(self):        
         """
             Transpose the adjacency list
@@ -61,52 +150,304 @@ class Skeleton:
         """
         point_to: List[np.array] = []
         for c in self.edges[joint_id]:
-            point_to.append(self.joints[c].location)
+            point_to.append(self._locations[c])
         
         if len(point_to) == 0:
-            point_to = [self.joints[self.edges_t[joint_id][0]].location]
-            return - np.mean(np.array(point_to), axis=0) + self.joints[joint_id].location
-        return np.mean(np.array(point_to), axis=0) - self.joints[joint_id].location
+            point_to = [self._locations[self.edges_t[joint_id][0]]]
+            return - np.mean(np.array(point_to), axis=0) + self._locations[joint_id]
+        return np.mean(np.array(point_to), axis=0) - self._locations[joint_id]
                 
     def __set_joints_basis_alignement(self, joints_angles: List[np.array]):        
         """
             Define joints basis orientations.
         """
-        for j in self.joints:            
-            z = self.__get_basis_target_z(joint_id=j.id)
-            z = z/np.linalg.norm(z)            
-            
-            j.align_basis_to_target_z(target_z=z)
-            j.rotate_basis_by_angles(angles=joints_angles[j.id])
-            
-    def refresh_visited_state(self):        
-        self.visited = [False]*len(self.joints)   
+        target_z = np.array([self.__get_basis_target_z(joint_id=j.id) for j in self.joints])
+        target_z = target_z/np.linalg.norm(target_z, axis=1, keepdims=True)
 
+        # align all the basis to their target z direction at once
+        q = utils.batch_from_2_vec_to_quat(v1=self._bases[:, 2, :], v2=target_z)
+        self._bases[:] = np.einsum('nij,nkj->nki', utils.q_to_matrix(q), self._bases)
+        self._bases[:, 2, :] = target_z
+        # then rotate them around their own x, y and z axes (see utils.rotate_basis_by_angles)
+        joints_angles = np.asarray(joints_angles, dtype=np.float64)
+        for i in range(3):
+            q = utils.batch_axisangle_to_q(v=self._bases[:, i, :], theta=joints_angles[:, i])
+            self._bases[:] = np.einsum('nij,nkj->nki', utils.q_to_matrix(q), self._bases)
+            
     def get_skeleton_config(self) -> List[Dict[str, Any]]:
-        conf = []
-        for j in self.joints:
-           conf + self.joints[j.id].get_joint_config()
-        return conf    
+        self.update()
+        return [j.config for j in self.joints]
     
     def joint_dfs_traversing(self, parent_id: int) -> List[int]:
         """
-            Depth first search trasversing of the skeleton.
+            Depth first search trasversing of the skeleton (childs of parent_id in preorder).
         """
-        self.visited[parent_id] = True
-        childs = []
-        
-        for j in self.edges[parent_id]: 
-            if not self.visited[j]:                                                                                                                        
-                childs += [j]+self.joint_dfs_traversing(parent_id=j)
-        return childs    
+        return self.topology.descendants(parent_id).tolist()
+
+    @property
+    def locations(self) -> np.array:
+        """
+            Joints locations :: shape = (n_joints, 3)
+        """
+        self.update()
+        return self._locations
+
+    @property
+    def bases(self) -> np.array:
+        """
+            Joints basis :: shape = (n_joints, 3, 3)
+        """
+        self.update()
+        return self._bases
+
+    def update(self, joints_id: Optional[List[int]] = None) -> None:
+        """
+            Recompose the world transforms of the dirty joints.
+
+            joints_id: List[int] - if provided only the chains from the roots to these joints are recomposed
+        """
+        needed = self.dirty
+        if joints_id is not None:
+            needed = needed & self.__chain_mask(joints_id=joints_id)
+        if not needed.any():
+            return
+        self.__compose(local_rotations=self.local_rotations, world_rotations=self.world_rotations, 
+                       locations=self._locations, bases=self._bases, needed=needed)
+        self.dirty = self.dirty & ~needed
+
+    def __chain_mask(self, joints_id: List[int]) -> np.array:
+        """
+            Mask of the joints on the chains from the roots to joints_id
+        """
+        key = tuple(joints_id)
+        if key not in self.__chains:
+            self.__chains[key] = self.topology.chains_mask(joints_id=joints_id)
+        return self.__chains[key]
+
+    def chains_groups(self, joints_id: List[int]) -> np.array:
+        """
+            Independent chains below the joints shared by joints_id (see Topology.decompose)
+
+            return np.array -> shape = (n_joints,), k for the joints only moving joints_id[k], -1 for shared joints
+        """
+        key = tuple(joints_id)
+        if key not in self.__groups:
+            self.__groups[key] = self.topology.decompose(joints_id=joints_id)
+        return self.__groups[key]
+
+    def get_locations(self, joints_id: List[int]) -> np.array:
+        """
+            Locations of joints_id, only the chains leading to them are recomposed
+
+            return np.array -> shape = (len(joints_id), 3)
+        """
+        self.update(joints_id=joints_id)
+        return self._locations[joints_id]
+
+    def get_chain_state(self, joints_id: List[int]) -> Tuple[np.array, np.array]:
+        """
+            Locations and basis arrays where the chains from the roots to joints_id are up to date,
+            joints out of these chains may be stale (they do not move joints_id).
+
+            return (locations, bases) -> shapes = (n_joints, 3), (n_joints, 3, 3)
+        """
+        self.update(joints_id=joints_id)
+        return self._locations, self._bases
+
+    def __compose(self, local_rotations: np.array, world_rotations: np.array, 
+                  locations: np.array, bases: np.array, needed: np.array) -> None:
+        """
+            Compose local rotations into world rotations, locations and basis, level by level from the roots.
+            Arrays can have leading batch dimensions, they are updated in place for the needed joints only.
+
+            needed: np.array -> shape = (n_joints,), it must contain the parents of each needed joint
+        """
+        for depth, level in enumerate(self.levels):
+            selected = needed[level]
+            if not selected.any():
+                continue
+            idx = level[selected]
+            if depth == 0:
+                world_rotations[..., idx, :, :] = local_rotations[..., idx, :, :]
+                locations[..., idx, :] = self.rest_locations[idx]
+            else:
+                p = self.levels_parents[depth][selected]
+                parents_rotations = world_rotations[..., p, :, :]
+                world_rotations[..., idx, :, :] = parents_rotations @ local_rotations[..., idx, :, :]
+                locations[..., idx, :] = locations[..., p, :] + (parents_rotations @ self.levels_offsets[depth][selected][..., None])[..., 0]
+            bases[..., idx, :, :] = self.rest_bases[idx] @ np.swapaxes(world_rotations[..., idx, :, :], -1, -2)
+
+    def __local_rotations(self, angles: np.array) -> np.array:
+        """
+            Rotation of each joint due to its own actuators, applied in the order they are listed.
+
+            angles: np.array -> shape = (..., n_joints, 3)
+            return np.array -> shape = (..., n_joints, 3, 3)
+        """
+        delta = angles - self.rest_angles
+        rotations = np.broadcast_to(np.eye(3), angles.shape[:-1] + (3, 3)).copy()
+        for joints, axes in self.actuators_ranks:
+            q = utils.batch_axisangle_to_q(v=self.rest_bases[joints, axes], theta=delta[..., joints, axes])
+            rotations[..., joints, :, :] = rotations[..., joints, :, :] @ utils.q_to_matrix(q)
+        return rotations
 
     def process_command(self, joint_id: int, command: np.array) -> None:             
-        childs_id = self.childs_collection[joint_id]
-        childs_cfgs = [self.joints[c].config for c in childs_id] 
-        self.joints[joint_id].apply_command(childs_configs=childs_cfgs, command=command)        
+        """
+            Actuate a joint, its subtree is only marked as dirty and recomposed when read
+        """
+        joint = self.joints[joint_id]
+        joint.apply_command(command=command)
+        for act in joint.actuators:
+            self.angles[joint_id, act.axis] = act.angle
+        self.local_rotations[joint_id] = joint.local_rotation(rest_basis=self.rest_bases[joint_id])
+        self.dirty[self.topology.subtree(joint_id)] = True
                                             
+    def jacobian(self, joints_id: List[int]) -> np.array:
+        """
+            Analytic derivative of the joints_id locations with respect to every actuator angle.
+
+            return np.array -> shape = (len(joints_id), 3, n_joints, 3)
+                    jac[k, :, j, i] is the derivative of joints_id[k] location with respect to
+                    the angle of the actuator of joint j rotating around its basis axis i.
+        """
+        locations, bases = self.get_chain_state(joints_id=joints_id)
+        return self.batch_jacobian(locations=locations[None], bases=bases[None], angles=self.angles[None], 
+                                   joints_id=joints_id)[0]
+
+    def batch_jacobian(self, locations: np.array, bases: np.array, angles: np.array, joints_id: List[int]) -> np.array:
+        """
+            Jacobian of a stack of skeleton states.
+
+            locations: np.array -> shape = (B, n_joints, 3)
+            bases: np.array -> shape = (B, n_joints, 3, 3)
+            angles: np.array -> shape = (B, n_joints, 3)
+            return np.array -> shape = (B, len(joints_id), 3, n_joints, 3)
+        """
+        # lever arms between each joint and each selected location :: shape = (B, K, N, 3)
+        levers = locations[:, joints_id, None, :] - locations[:, None, :, :]
+        # actuators rotate by -angle around the axis (see utils.qv_mult) so d(loc)/d(angle) = lever x axis
+        jac = np.cross(levers[:, :, :, None, :], self.actuators_axes(bases=bases, angles=angles)[:, None, :, :, :])
+        mask = self.topology.ancestors_mask(joints_id=joints_id)[:, :, None] & self.actuated_axes[None, :, :]
+        jac *= mask[None, ..., None]
+        return np.transpose(jac, (0, 1, 4, 2, 3))
+
+    def actuators_axes(self, bases: np.array, angles: np.array) -> np.array:
+        """
+            World axis each actuator rotates around, axes[..., j, i] for the actuator of joint j on basis axis i.
+            The last actuator of a joint rotates around the current basis axis, the previous ones around
+            the basis axis before the following actuators of the same joint are applied.
+
+            bases: np.array -> shape = (..., n_joints, 3, 3)
+            angles: np.array -> shape = (..., n_joints, 3)
+            return np.array -> shape = (..., n_joints, 3, 3)
+        """
+        axes = bases.copy()
+        if len(self.actuators_ranks) < 2:
+            return axes
+        delta = angles - self.rest_angles
+        # rotation of the following actuators of the same joint, in the joint rest system
+        following = np.broadcast_to(np.eye(3), angles.shape[:-1] + (3, 3)).copy()
+        for joints, axs in reversed(self.actuators_ranks):
+            axes[..., joints, axs, :] = (following[..., joints, axs, None, :] @ bases[..., joints, :, :])[..., 0, :]
+            q = utils.batch_axisangle_to_q(v=np.eye(3)[axs], theta=delta[..., joints, axs])
+            following[..., joints, :, :] = utils.q_to_matrix(q) @ following[..., joints, :, :]
+        return axes
+
+    def batch_forward_kinematics(self, angles: np.array) -> Tuple[np.array, np.array]:
+        """
+            Joints locations and basis for a stack of actuators angles.
+            The actuators of each joint are applied in the order they are listed, starting from the rest state.
+
+            angles: np.array -> shape = (B, n_joints, 3), same layout of get_angles
+            return (locations, bases) -> shapes = (B, n_joints, 3), (B, n_joints, 3, 3)
+        """
+        local_rotations = self.__local_rotations(angles=angles)
+        world_rotations = np.empty_like(local_rotations)
+        locations = np.empty(shape=angles.shape)
+        bases = np.empty_like(local_rotations)
+        self.__compose(local_rotations=local_rotations, world_rotations=world_rotations, locations=locations, 
+                       bases=bases, needed=np.ones(shape=(len(self.joints),), dtype=bool))
+        return locations, bases
+
+    def sample_angles(self, n_samples: int, rng: np.random.Generator) -> np.array:
+        """
+            Uniform samples of the actuators angles within their constraints (unbounded actuators in [-pi, pi])
+
+            return np.array -> shape = (n_samples, n_joints, 3), same layout of get_angles
+        """
+        low = np.where(np.isinf(self.angles_min), -np.pi, self.angles_min)
+        high = np.where(np.isinf(self.angles_max), np.pi, self.angles_max)
+        return rng.uniform(low, high, size=(n_samples, len(self.joints), 3))
+
+    def pack_angles(self, angles: np.array) -> np.array:
+        """
+            Compact layout of the actuators angles, one column for each row of actuators_index
+
+            angles: np.array -> shape = (..., n_joints, 3), same layout of get_angles
+            return np.array -> shape = (..., n_actuators)
+        """
+        return angles[..., self.actuators_index[:, 0], self.actuators_index[:, 1]]
+
+    def unpack_angles(self, packed: np.array) -> np.array:
+        """
+            Inverse of pack_angles, axes without actuator are 0
+
+            return np.array -> shape = (..., n_joints, 3)
+        """
+        angles = np.zeros(shape=packed.shape[:-1] + (len(self.joints), 3))
+        angles[..., self.actuators_index[:, 0], self.actuators_index[:, 1]] = packed
+        return angles
+
+    def get_angles(self) -> np.array:
+        """
+            Actuators angles, same layout of the angular part of Robot.delta_commands
+
+            return np.array -> shape = (n_joints, 3)
+        """
+        return self.angles.copy()
+
+    def set_angles(self, angles: np.array) -> None:
+        """
+            Move the skeleton to the pose defined by the actuators angles (see batch_forward_kinematics)
+
+            angles: np.array -> shape = (n_joints, 3), same layout of get_angles
+        """
+        self.angles[:] = angles
+        for j in self.joints:
+            for act in j.actuators:
+                act.angle = self.angles[j.id, act.axis]
+        self.local_rotations = self.__local_rotations(angles=self.angles)
+        self.dirty[:] = True
+
+    def snapshot(self) -> Dict[str, np.array]:
+        """
+            Get a copy of the skeleton state (joints locations, basis and actuators angles)
+        """
+        return {
+            "locations": self.locations.copy(),
+            "bases": self.bases.copy(),
+            "angles": self.get_angles()
+        }
+
+    def restore(self, snapshot: Dict[str, np.array]) -> None:
+        """
+            Restore a state previously returned by snapshot, the pose is fully defined by the angles
+        """
+        self.set_angles(angles=snapshot["angles"])
+
     def get_shadow(self) -> Skeleton:  
         """
-            Get a copy of the Skeleton
+            Get a copy of the Skeleton.
+            Topology is shared with the original skeleton, state arrays and actuators are copied.
         """      
-        return copy.deepcopy(self)
+        instrumentation.count("shadow_copies")
+        shadow = copy.copy(self)
+        shadow._locations = self._locations.copy()
+        shadow._bases = self._bases.copy()
+        shadow.angles = self.angles.copy()
+        shadow.local_rotations = self.local_rotations.copy()
+        shadow.world_rotations = self.world_rotations.copy()
+        shadow.dirty = self.dirty.copy()
+        shadow.joints = [Joint(id=j.id, actuators=[copy.copy(act) for act in j.actuators]) for j in self.joints]
+        shadow.__bind_joints()
+        return shadow
@@ -0,0 +1,113 @@
+import sys
+import itertools
+import numpy as np
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Dict, Tuple, Optional, Any
+
+
+@dataclass
+class CachedSolution:
+    target: np.array  # target the solution was computed for
+    angles: np.array  # (n_joints, 3) actuators angles, same layout of Skeleton.get_angles
+    error: float
+
+
+class SolutionCache:
+    def __init__(self, voxel_size: float = 1.0, max_entries: int = 4096, search_radius: int = 1) -> None:
+        """
+            Converged solutions indexed by target, used to warm start new solves.
+            Targets are hashed on a voxel grid (one solution per voxel, per joints_id set and per target shape,
+            a (3,) target shared by joints_id and a (len(joints_id), 3) target are different problems),
+            the least recently used voxel is evicted when the cache is full.
+
+            voxel_size: float - edge of the voxels, same unit of the robot geometry
+            max_entries: int - maximum number of stored solutions
+            search_radius: int - voxels searched around the target voxel (in each direction)
+        """
+        self.voxel_size = voxel_size
+        self.max_entries = max_entries
+        self.offsets = np.array(list(itertools.product(range(-search_radius, search_radius+1), repeat=3)))
+        self.entries: OrderedDict[Tuple, CachedSolution] = OrderedDict()
+
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.cold_solves = 0
+        self.cold_iterations = 0    # iterations spent by solves without seed
+        self.warm_solves = 0
+        self.warm_iterations = 0    # iterations spent by seeded solves
+
+    def __voxel(self, target: np.array) -> np.array:
+        # a set of targets (one per joint) is hashed by its centroid
+        return np.floor(np.asarray(target, dtype=np.float64).reshape(-1, 3).mean(axis=0)/self.voxel_size).astype(int)
+
+    def __key(self, target: np.array, joints_id: List[int], voxel: np.array) -> Tuple:
+        return (tuple(joints_id), np.shape(target), *voxel)
+
+    def lookup(self, target: np.array, joints_id: List[int]) -> Optional[np.array]:
+        """
+            Angles of the stored solution closest to target, None if no solution is stored nearby
+        """
+        voxel = self.__voxel(target=target)
+        best: Optional[Tuple] = None
+        best_dist = np.inf
+        for offset in self.offsets:
+            key = self.__key(target=target, joints_id=joints_id, voxel=voxel + offset)
+            entry = self.entries.get(key)
+            if entry is not None:
+                dist = np.sum((entry.target - target)**2)
+                if dist < best_dist:
+                    best, best_dist = key, dist
+
+        if best is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(best)
+        return self.entries[best].angles.copy()
+
+    def store(self, target: np.array, joints_id: List[int], angles: np.array, error: float) -> None:
+        """
+            Store a solution, it replaces the solution previously stored in the same voxel
+        """
+        key = self.__key(target=target, joints_id=joints_id, voxel=self.__voxel(target=target))
+        self.entries[key] = CachedSolution(target=np.array(target, dtype=np.float64), angles=np.array(angles), error=error)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def record_iterations(self, iterations: int, seeded: bool) -> None:
+        """
+            Iterations spent by a solve that looked up the cache
+        """
+        if seeded:
+            self.warm_solves += 1
+            self.warm_iterations += iterations
+        else:
+            self.cold_solves += 1
+            self.cold_iterations += iterations
+
+    @property
+    def memory_bytes(self) -> int:
+        """
+            Approximate memory used by the stored solutions
+        """
+        per_entry = [e.target.nbytes + e.angles.nbytes + sys.getsizeof(e) + sys.getsizeof(k) for k, e in self.entries.items()]
+        return sys.getsizeof(self.entries) + int(np.sum(per_entry))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+            Hit rate, iterations saved by the seeded solves (with respect to the mean cost of a solve
+            without seed, None until a solve without seed is recorded) and memory use
+        """
+        lookups = self.hits + self.misses
+        cold_mean = self.cold_iterations/self.cold_solves if self.cold_solves > 0 else None
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits/lookups if lookups > 0 else 0.0,
+            "iterations_saved": None if cold_mean is None else cold_mean*self.warm_solves - self.warm_iterations,
+            "memory_bytes": self.memory_bytes
+        }
@@ -0,0 +1,12 @@
+import os
+import sys
+
+# modules live at the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIGS_DIR = os.path.join(ROOT, 'resources', 'configs')
+sys.path.insert(0, ROOT)
+
+
+def parse_robot(config: str):
+    from config_parser import RobotConfigParser
+    return RobotConfigParser(path=os.path.join(CONFIGS_DIR, config)).parse()
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+from conftest import parse_robot
+from analytic import PlanarChain
+from robot import Optimizer
+
+PLANAR_CONFIGS = ["armConfig - 2 joints.yml", "armConfig - 3 joints.yml", "armConfig - 3 joints_constr.yml"]
+
+
+@pytest.mark.parametrize("config", PLANAR_CONFIGS)
+def test_analytic_reaches_sampled_targets_within_constraints(config):
+    robot = parse_robot(config)
+    skeleton = robot.skeleton
+    effector = len(skeleton.joints) - 1
+    assert PlanarChain.detect(skeleton=skeleton, joints_id=[effector]) is not None
+    # targets sampled within the constraints are reachable
+    angles = skeleton.sample_angles(n_samples=50, rng=np.random.default_rng(0))
+    targets = skeleton.batch_forward_kinematics(angles=angles)[0][:, effector]
+    for target in targets:
+        result = robot.inverse_kinematics(target=target, joints_id=[effector], optimizer=Optimizer.ANALYTIC, atol=1e-6)
+        assert result.converged and result.error <= 1e-6
+        assert np.all((result.angles >= skeleton.angles_min) & (result.angles <= skeleton.angles_max))
+
+
+def test_hand_has_no_closed_form():
+    skeleton = parse_robot("hand.yml").skeleton
+    # fingers hang from joints with several actuators
+    assert PlanarChain.detect(skeleton=skeleton, joints_id=[len(skeleton.joints) - 1]) is None
+    assert PlanarChain.detect(skeleton=skeleton, joints_id=[4, 13]) is None
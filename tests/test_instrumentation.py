@@ -0,0 +1,19 @@
+import json
+import numpy as np
+from conftest import parse_robot
+from instrumentation import Instrumentation
+from robot import Optimizer
+
+
+def test_trace_of_ndarray_joints_exports_to_json():
+    robot = parse_robot("hand.yml")
+    joints_id = np.array([7, 11])
+    target = robot.skeleton.get_locations(joints_id=joints_id.tolist()) + .1
+    with Instrumentation() as instrumentation:
+        robot.inverse_kinematics(target=target, joints_id=joints_id, optimizer=Optimizer.LEVENBERG_MARQUARDT,
+                                 max_iterations=5)
+    stats = json.loads(instrumentation.to_json())
+    solve, = stats["solves"]
+    assert solve["joints_id"] == [7, 11]
+    assert len(solve["errors"]) == stats["counters"]["iterations"] > 0
+    assert solve["reason"] in ("converged", "stalled", "max_iterations")
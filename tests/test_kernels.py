@@ -0,0 +1,54 @@
+import os
+import glob
+import numpy as np
+import pytest
+from conftest import CONFIGS_DIR
+from config_parser import RobotConfigParser
+from kernels import Backend, SkeletonArrays, NUMBA_AVAILABLE, compare_backends
+
+CONFIGS = sorted(glob.glob(os.path.join(CONFIGS_DIR, '*.yml')))
+TOLERANCE = 1e-9
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=os.path.basename)
+def test_kernel_matches_numpy(config):
+    # the kernel runs interpreted when numba is not installed
+    robot = RobotConfigParser(path=config).parse()
+    differences = compare_backends(robot=robot, n_samples=16)
+    scale = max(float(np.max(np.abs(robot.skeleton.rest_locations))), 1.0)
+    for name, difference in differences.items():
+        assert difference <= TOLERANCE*scale**2, name
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=os.path.basename)
+def test_kernel_clamps_like_numpy(config):
+    robot = RobotConfigParser(path=config).parse()
+    skeleton = robot.skeleton
+    rng = np.random.default_rng(0)
+    # every finite constraint exceeded, half of the poses below the minimum and half above the maximum
+    low = np.where(np.isinf(skeleton.angles_min), -np.pi, skeleton.angles_min) - .3
+    high = np.where(np.isinf(skeleton.angles_max), np.pi, skeleton.angles_max) + .3
+    angles = np.concatenate((np.broadcast_to(low, (4,) + low.shape), np.broadcast_to(high, (4,) + high.shape)))
+    angles = angles + rng.uniform(-.1, .1, size=angles.shape)*skeleton.actuated_axes
+    joints_id = [len(skeleton.joints) - 1]
+    targets = rng.normal(scale=5.0, size=(len(angles), 3))
+
+    clamped, *evaluated = SkeletonArrays.from_skeleton(skeleton=skeleton).evaluate(
+        angles=angles, targets=targets[:, None, :], weights=np.ones(shape=(len(angles), 1)), joints_id=joints_id)
+    reference = robot.batch_evaluate(angles=angles, targets=targets, joints_id=joints_id, backend=Backend.NUMPY)
+    np.testing.assert_array_equal(clamped, np.clip(angles, skeleton.angles_min, skeleton.angles_max))
+    for a, b in zip(evaluated, reference):
+        np.testing.assert_allclose(a, b, rtol=0, atol=TOLERANCE*100)
+
+
+@pytest.mark.skipif(not NUMBA_AVAILABLE, reason="numba is not installed")
+@pytest.mark.parametrize("config", CONFIGS, ids=os.path.basename)
+def test_numba_backend_matches_numpy(config):
+    robot = RobotConfigParser(path=config).parse()
+    skeleton = robot.skeleton
+    angles = skeleton.sample_angles(n_samples=8, rng=np.random.default_rng(0))*1.2
+    targets = skeleton.rest_locations[[0, -1]] + np.random.default_rng(1).normal(size=(8, 2, 3))
+    joints_id = [0, len(skeleton.joints) - 1]
+    for a, b in zip(robot.batch_evaluate(angles=angles, targets=targets, joints_id=joints_id, backend=Backend.NUMBA),
+                    robot.batch_evaluate(angles=angles, targets=targets, joints_id=joints_id, backend=Backend.NUMPY)):
+        np.testing.assert_allclose(a, b, rtol=0, atol=TOLERANCE*100)
@@ -0,0 +1,79 @@
+import os
+import numpy as np
+import pytest
+from conftest import CONFIGS_DIR
+from config_parser import RobotConfigParser
+from robot import Robot, Optimizer
+
+ARM_CONFIGS = ["armConfig - 2 joints.yml", "armConfig - 3 joints.yml", "armConfig - 3 joints_constr.yml"]
+
+
+def parse(config: str) -> Robot:
+    return RobotConfigParser(path=os.path.join(CONFIGS_DIR, config)).parse()
+
+
+@pytest.mark.parametrize("config", ARM_CONFIGS)
+def test_multi_chain_single_effector(config):
+    # no joint is shared by several chains, the Schur complement is empty
+    robot = parse(config)
+    effector = len(robot.skeleton.joints) - 1
+    target = robot.skeleton.batch_forward_kinematics(angles=robot.skeleton.sample_angles(
+        n_samples=1, rng=np.random.default_rng(0)))[0][0, effector]
+    result = robot.inverse_kinematics(target=target, joints_id=[effector], optimizer=Optimizer.MULTI_CHAIN)
+    reference = parse(config).inverse_kinematics(target=target, joints_id=[effector], 
+                                                 optimizer=Optimizer.LEVENBERG_MARQUARDT)
+    assert result.iterations == reference.iterations
+    np.testing.assert_allclose(result.angles, reference.angles, atol=1e-9)
+
+
+def test_batch_vertices_distance_matches_vertices_distance():
+    rng = np.random.default_rng(0)
+    points, target, weights = rng.normal(size=(4, 5, 3)), rng.normal(size=(5, 3)), rng.uniform(size=(5,))
+    costs = Robot.batch_vertices_distance(pt_list=points, target=target, weights=weights)
+    np.testing.assert_allclose(costs, [Robot.vertices_distance(pt_list=p, target=target, weights=weights) for p in points])
+
+
+def test_stream_recovers_after_unreachable_target():
+    # rejected steps on an unreachable target must not leave a damping that freezes the following ticks
+    robot = parse("armConfig - 3 joints.yml")
+    targets = [np.array([-30., 1., 5.])]*200 + [np.array([3., 4., 5.])]*20
+    ticks = list(robot.stream_inverse_kinematics(targets=targets, joints_id=[3], budget=1.0, atol=1e-4,
+                                                 optimizer=Optimizer.LEVENBERG_MARQUARDT))
+    assert all(not tick.converged for tick in ticks[:200])
+    assert robot.damping <= Robot.MAX_DAMPING
+    assert ticks[-1].converged and ticks[-1].error <= 1e-4
+
+
+def line_waypoints(robot: Robot, effector: int, n_waypoints: int) -> np.array:
+    # straight line between two reachable locations of the effector
+    locations, _ = robot.skeleton.batch_forward_kinematics(angles=robot.skeleton.sample_angles(
+        n_samples=2, rng=np.random.default_rng(0)))
+    return np.linspace(locations[0, effector], locations[1, effector], n_waypoints)
+
+
+def test_trajectory_errors_match_forward_kinematics():
+    robot = parse("armConfig - 3 joints.yml")
+    effector = len(robot.skeleton.joints) - 1
+    waypoints = line_waypoints(robot=robot, effector=effector, n_waypoints=20)
+    result = robot.solve_trajectory(waypoints=waypoints, joints_id=[effector], max_step=None, atol=1e-6)
+    assert result.converged.all() and (result.errors <= 1e-6).all()
+    angles = np.array([robot.skeleton.unpack_angles(packed=a) for a in result.angles])
+    locations, _ = robot.skeleton.batch_forward_kinematics(angles=angles)
+    np.testing.assert_allclose(result.errors, np.sum((locations[:, effector] - waypoints)**2, axis=1), atol=1e-12)
+    # the skeleton is left at the last pose
+    np.testing.assert_allclose(robot.skeleton.get_angles(), angles[-1])
+
+
+def test_trajectory_steps_are_clipped_to_max_step():
+    robot = parse("armConfig - 3 joints.yml")
+    effector = len(robot.skeleton.joints) - 1
+    waypoints = line_waypoints(robot=robot, effector=effector, n_waypoints=5)
+    initial = robot.skeleton.get_angles()
+    max_step = np.pi/90
+    result = robot.solve_trajectory(waypoints=waypoints, joints_id=[effector], max_step=max_step, atol=1e-6)
+    angles = np.array([robot.skeleton.unpack_angles(packed=a) for a in result.angles])
+    steps = np.max(np.abs(np.diff(np.concatenate((initial[None], angles)), axis=0)), axis=(1, 2))
+    assert (steps <= max_step + 1e-12).all()
+    # waypoints far from the previous pose are clipped and reported as not converged
+    clipped = np.isclose(steps, max_step)
+    assert clipped.any() and not result.converged[clipped].any()
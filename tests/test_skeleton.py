@@ -0,0 +1,137 @@
+import tracemalloc
+import numpy as np
+import pytest
+from conftest import parse_robot
+from actuator import RotaryActuator
+from joints import Joint
+from skeleton import Skeleton
+
+CONFIGS = ["armConfig - 2 joints.yml", "armConfig - 3 joints.yml", "armConfig - 3 joints_constr.yml", "hand.yml"]
+
+
+def random_angles(skeleton, n_samples: int, seed: int = 0) -> np.array:
+    return skeleton.sample_angles(n_samples=n_samples, rng=np.random.default_rng(seed))
+
+
+def central_differences(skeleton, angles: np.array, joints_id, eps: float = 1e-6) -> np.array:
+    """
+        return np.array -> shape = (B, len(joints_id), 3, n_joints, 3), same layout of Skeleton.batch_jacobian
+    """
+    jac = np.zeros(shape=(len(angles), len(joints_id), 3) + angles.shape[1:])
+    for j, i in np.argwhere(skeleton.actuated_axes):
+        delta = np.zeros_like(angles)
+        delta[:, j, i] = eps
+        plus, _ = skeleton.batch_forward_kinematics(angles=angles + delta)
+        minus, _ = skeleton.batch_forward_kinematics(angles=angles - delta)
+        jac[..., j, i] = (plus[:, joints_id] - minus[:, joints_id])/(2*eps)
+    return jac
+
+
+@pytest.mark.parametrize("config", CONFIGS)
+def test_batch_jacobian_matches_central_differences(config):
+    skeleton = parse_robot(config).skeleton
+    angles = random_angles(skeleton=skeleton, n_samples=4)
+    joints_id = list(range(len(skeleton.joints)))
+    locations, bases = skeleton.batch_forward_kinematics(angles=angles)
+    jac = skeleton.batch_jacobian(locations=locations, bases=bases, angles=angles, joints_id=joints_id)
+    np.testing.assert_allclose(jac, central_differences(skeleton=skeleton, angles=angles, joints_id=joints_id), 
+                               atol=1e-6)
+
+
+@pytest.mark.parametrize("config", CONFIGS)
+def test_jacobian_matches_central_differences(config):
+    skeleton = parse_robot(config).skeleton
+    angles = random_angles(skeleton=skeleton, n_samples=1, seed=1)
+    skeleton.set_angles(angles=angles[0])
+    joints_id = [len(skeleton.joints) - 1, 0]
+    np.testing.assert_allclose(skeleton.jacobian(joints_id=joints_id), 
+                               central_differences(skeleton=skeleton, angles=angles, joints_id=joints_id)[0], atol=1e-6)
+
+
+def test_hand_has_joints_with_two_actuators():
+    # the jacobian tests above cover actuators rotated by the following actuators of their joint
+    skeleton = parse_robot("hand.yml").skeleton
+    assert max(len(j.actuators) for j in skeleton.joints) == 2
+
+
+def random_commands(skeleton, rng: np.random.Generator, n_commands: int):
+    for _ in range(n_commands):
+        joint = skeleton.joints[rng.integers(len(skeleton.joints))]
+        command = np.zeros(shape=(6,))
+        command[:3] = rng.uniform(-.3, .3, size=(3,))
+        yield joint.id, command
+
+
+@pytest.mark.parametrize("config", CONFIGS)
+def test_lazy_composition_matches_batch_forward_kinematics(config):
+    skeleton = parse_robot(config).skeleton
+    rng = np.random.default_rng(0)
+    for step in range(30):
+        if step % 10 == 0:
+            skeleton.set_angles(angles=random_angles(skeleton=skeleton, n_samples=1, seed=step)[0])
+        for joint_id, command in random_commands(skeleton=skeleton, rng=rng, n_commands=3):
+            skeleton.process_command(joint_id=joint_id, command=command)
+        # a chain read only recomposes the joints the queried ones depend on
+        joints_id = [int(rng.integers(len(skeleton.joints)))]
+        locations, bases = skeleton.batch_forward_kinematics(angles=skeleton.get_angles()[None])
+        np.testing.assert_allclose(skeleton.get_locations(joints_id=joints_id), locations[0, joints_id], atol=1e-12)
+        np.testing.assert_allclose(skeleton.locations, locations[0], atol=1e-12)
+        np.testing.assert_allclose(skeleton.bases, bases[0], atol=1e-12)
+        assert not skeleton.dirty.any()
+
+
+def test_reading_locations_recomposes():
+    skeleton = parse_robot("armConfig - 3 joints.yml").skeleton
+    before = skeleton.locations.copy()
+    command = np.zeros(shape=(6,))
+    command[skeleton.joints[1].actuators[0].axis] = .5
+    skeleton.process_command(joint_id=1, command=command)
+    # actuations only mark the subtree of the joint as dirty
+    assert skeleton.dirty[skeleton.topology.subtree(1)].all() and not skeleton.dirty[0]
+    after = skeleton.locations
+    assert not np.allclose(after[-1], before[-1])
+    np.testing.assert_allclose(after, skeleton.batch_forward_kinematics(angles=skeleton.get_angles()[None])[0][0])
+
+
+@pytest.mark.parametrize("move", ["process_command", "set_angles"])
+def test_joint_views_are_recomposed_when_read(move):
+    skeleton = parse_robot("hand.yml").skeleton
+    joint = skeleton.joints[2]
+    before = joint.location.copy()
+    if move == "process_command":
+        command = np.zeros(shape=(6,))
+        command[skeleton.joints[1].actuators[0].axis] = .5
+        skeleton.process_command(joint_id=1, command=command)
+    else:
+        skeleton.set_angles(angles=random_angles(skeleton=skeleton, n_samples=1)[0])
+    locations, bases = skeleton.batch_forward_kinematics(angles=skeleton.get_angles()[None])
+    # no explicit update, the joint reads through the skeleton
+    assert not np.allclose(joint.location, before)
+    np.testing.assert_allclose(joint.location, locations[0, 2], atol=1e-12)
+    np.testing.assert_allclose(joint.basis, bases[0, 2], atol=1e-12)
+    with pytest.raises(ValueError):
+        joint.location[0] = 0.0
+
+
+def build_chain(n_joints: int) -> Skeleton:
+    joints = [Joint(id=i, actuators=[RotaryActuator(axis=0, constraints={"min": -90, "max": 90}, start_angle=0.0)])
+              for i in range(n_joints)]
+    edges = [[i + 1] for i in range(n_joints - 1)] + [[]]
+    locations = np.stack((np.zeros(n_joints), np.zeros(n_joints), np.arange(n_joints, dtype=np.float64)), axis=1)
+    return Skeleton(joints=joints, joints_loc=locations, joints_angles=np.zeros(shape=(n_joints, 3)), edges=edges)
+
+
+def test_chain_construction_scales_linearly():
+    # dense (n_joints, n_joints) masks or root to joint lists per joint grow quadratically along a chain
+    peaks = []
+    for n_joints in (1000, 4000):
+        tracemalloc.start()
+        skeleton = build_chain(n_joints=n_joints)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    assert peaks[1] < 6*peaks[0]
+
+    topology = skeleton.topology
+    np.testing.assert_array_equal(topology.chain(n_joints - 1), np.arange(n_joints))
+    assert (topology.decompose(joints_id=[10, 20]) == np.r_[[-1]*11, [1]*10, [-2]*(n_joints - 21)]).all()
+    assert topology.ancestors_mask(joints_id=[5]).sum() == 5
@@ -0,0 +1,43 @@
+import numpy as np
+from conftest import parse_robot
+from robot import Optimizer
+from solution_cache import SolutionCache
+from workspace import WorkspaceMap
+
+
+def test_target_shape_is_part_of_the_key():
+    cache = SolutionCache(voxel_size=1.0)
+    angles = np.ones(shape=(4, 3))
+    cache.store(target=np.array([1., 1., 1.]), joints_id=[2, 3], angles=angles, error=0.0)
+    # same centroid, but each joint has its own target
+    assert cache.lookup(target=np.array([[0., 1., 1.], [2., 1., 1.]]), joints_id=[2, 3]) is None
+    np.testing.assert_array_equal(cache.lookup(target=np.array([1.1, 1., 1.]), joints_id=[2, 3]), angles)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_iterations_saved_needs_a_cold_baseline():
+    cache = SolutionCache()
+    cache.record_iterations(iterations=3, seeded=True)
+    assert cache.stats()["iterations_saved"] is None
+    cache.record_iterations(iterations=10, seeded=False)
+    cache.record_iterations(iterations=4, seeded=False)
+    assert cache.stats()["iterations_saved"] == 7*1 - 3
+
+
+def test_workspace_seed_is_not_a_cache_hit():
+    robot = parse_robot("armConfig - 3 joints.yml")
+    effector = len(robot.skeleton.joints) - 1
+    workspace = WorkspaceMap.build(robot=robot, joints_id=[effector], n_samples=2000)
+    cache = SolutionCache()
+    target = robot.skeleton.batch_forward_kinematics(angles=robot.skeleton.sample_angles(
+        n_samples=1, rng=np.random.default_rng(1)))[0][0, effector]
+    first = robot.inverse_kinematics(target=target, joints_id=[effector], optimizer=Optimizer.LEVENBERG_MARQUARDT,
+                                     atol=1e-6, cache=cache, workspace=workspace)
+    assert first.converged
+    # the workspace seeded the solve after the cache missed, it is the cold baseline
+    assert (cache.hits, cache.misses, cache.cold_solves, cache.warm_solves) == (0, 1, 1, 0)
+
+    robot.inverse_kinematics(target=target, joints_id=[effector], optimizer=Optimizer.LEVENBERG_MARQUARDT,
+                             atol=1e-6, cache=cache, workspace=workspace)
+    assert (cache.hits, cache.misses, cache.cold_solves, cache.warm_solves) == (1, 1, 1, 1)
+    assert cache.stats()["iterations_saved"] == first.iterations
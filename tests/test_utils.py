@@ -0,0 +1,38 @@
+import numpy as np
+import utils
+
+
+def random_quaternions(n: int, seed: int = 0) -> np.array:
+    q = np.random.default_rng(seed).normal(size=(n, 4))
+    q = q/np.linalg.norm(q, axis=1, keepdims=True)
+    # matrix_to_q returns the quaternion with non negative w (q and -q are the same rotation)
+    return q*np.where(q[:, :1] < 0, -1.0, 1.0)
+
+
+def test_quaternion_matrix_round_trip():
+    q = random_quaternions(n=64)
+    np.testing.assert_allclose(utils.matrix_to_q(utils.q_to_matrix(q)), q, atol=1e-12)
+    np.testing.assert_allclose(utils.matrix_to_q(utils.q_to_matrix(q[0])), q[0], atol=1e-12)
+
+
+def test_matrix_rotates_like_qv_mult():
+    q = random_quaternions(n=8, seed=1)
+    v = np.random.default_rng(2).normal(size=(3,))
+    for qi, rotation in zip(q, utils.q_to_matrix(q)):
+        np.testing.assert_allclose(rotation @ v, utils.qv_mult(q1=qi, v1=v), atol=1e-12)
+
+
+def test_rotate_points_and_bases():
+    rng = np.random.default_rng(3)
+    q = random_quaternions(n=1, seed=4)[0]
+    rotation = utils.q_to_matrix(q)
+    points, origin = rng.normal(size=(10, 3)), rng.normal(size=(3,))
+    bases = utils.q_to_matrix(random_quaternions(n=10, seed=5))
+
+    rotated = utils.rotate_points(rotation=rotation, points=points, origin=origin)
+    np.testing.assert_allclose(rotated, [utils.qv_mult(q1=q, v1=p - origin) + origin for p in points], atol=1e-12)
+    rotated_bases = utils.rotate_bases(rotation=rotation, bases=bases)
+    np.testing.assert_allclose(rotated_bases, [[utils.qv_mult(q1=q, v1=axis) for axis in b] for b in bases], atol=1e-12)
+    # rotated bases stay orthonormal
+    np.testing.assert_allclose(rotated_bases @ np.swapaxes(rotated_bases, 1, 2), np.broadcast_to(np.eye(3), (10, 3, 3)), 
+                               atol=1e-12)
@@ -0,0 +1,129 @@
+from __future__ import annotations
+import numpy as np
+from typing import List, Dict, Tuple
+
+
+class Topology:
+    def __init__(self, edges: List[List[int]]) -> None:
+        """
+            Index of a forest of joints built once, without recursion.
+
+            parents: np.array -> shape = (n_joints,), parent of each joint (-1 for roots)
+            order: np.array -> shape = (n_joints,), depth first preorder, childs in the order they are listed
+            tin, tout: np.array -> shape = (n_joints,), Euler tour ranges, order[tin[j]:tout[j]] is the subtree of j
+                                   (j followed by its descendants)
+            depth: np.array -> shape = (n_joints,), 0 for roots
+
+            edges: List[List[int]] - adjacency list, childs of each joint
+        """
+        n_joints = len(edges)
+        self.parents: np.array = np.full(shape=(n_joints,), fill_value=-1, dtype=int)
+        for parent, childs in enumerate(edges):
+            if np.any(self.parents[childs] >= 0):
+                raise ValueError(f"joints {childs} have more than one parent, edges must describe a forest")
+            self.parents[childs] = parent
+
+        order: List[int] = []
+        stack = list(reversed(np.flatnonzero(self.parents < 0).tolist()))
+        while stack:
+            j = stack.pop()
+            order.append(j)
+            stack.extend(reversed(edges[j]))
+        if len(order) != n_joints:
+            raise ValueError("edges contain a cycle, some joints are not reachable from a root")
+        self.order: np.array = np.array(order, dtype=int)
+        self.__index()
+
+    @classmethod
+    def from_arrays(cls, parents: np.array, order: np.array) -> Topology:
+        """
+            Rebuild the index from the arrays of a previously built topology (see to_arrays)
+        """
+        topology = cls.__new__(cls)
+        topology.parents = np.asarray(parents, dtype=int)
+        topology.order = np.asarray(order, dtype=int)
+        topology.__index()
+        return topology
+
+    def to_arrays(self) -> Dict[str, np.array]:
+        return {"parents": self.parents, "order": self.order}
+
+    def __index(self) -> None:
+        """
+            Euler tour ranges and depths from parents and order, O(n_joints) memory:
+            a is an ancestor of j (or j itself) if tin[a] <= tin[j] < tout[a]
+        """
+        n_joints = len(self.parents)
+        self.tin: np.array = np.empty(shape=(n_joints,), dtype=int)
+        self.tin[self.order] = np.arange(n_joints)
+        # subtree sizes accumulated from the leaves, childs come after their parent in the preorder
+        size = np.ones(shape=(n_joints,), dtype=int)
+        for j in self.order[::-1]:
+            if self.parents[j] >= 0:
+                size[self.parents[j]] += size[j]
+        self.tout: np.array = self.tin + size
+
+        self.depth: np.array = np.zeros(shape=(n_joints,), dtype=int)
+        for j in self.order:
+            p = self.parents[j]
+            self.depth[j] = self.depth[p] + 1 if p >= 0 else 0
+        # joints grouped by depth, a level only depends on the previous one
+        self.levels: List[np.array] = np.split(np.argsort(self.depth, kind="stable"), np.cumsum(np.bincount(self.depth))[:-1])
+
+    def subtree(self, joint_id: int) -> np.array:
+        """
+            joint_id followed by its descendants (preorder), a view onto order
+        """
+        return self.order[self.tin[joint_id]:self.tout[joint_id]]
+
+    def descendants(self, joint_id: int) -> np.array:
+        return self.order[self.tin[joint_id] + 1:self.tout[joint_id]]
+
+    def chain(self, joint_id: int) -> np.array:
+        """
+            Joints from the root to joint_id (included), walking up the parents
+        """
+        chain = np.empty(shape=(self.depth[joint_id] + 1,), dtype=int)
+        j = joint_id
+        for i in range(len(chain) - 1, -1, -1):
+            chain[i] = j
+            j = self.parents[j]
+        return chain
+
+    def ancestors_mask(self, joints_id: List[int]) -> np.array:
+        """
+            return np.array -> shape = (len(joints_id), n_joints), [k, a] is True if a is a strict ancestor of joints_id[k]
+        """
+        tin = self.tin[np.asarray(joints_id, dtype=int)][:, None]
+        return (self.tin[None, :] < tin) & (tin < self.tout[None, :])
+
+    def __chains_counts(self, joints_id: List[int]) -> Tuple[np.array, np.array, np.array]:
+        """
+            Number of joints_id in the subtree of each joint, from the sorted Euler tour entries of joints_id
+
+            return (counts, tins, ranks) - tins sorted, joints_id[ranks[i]] enters the tour at tins[i]
+        """
+        ranks = np.argsort(self.tin[np.asarray(joints_id, dtype=int)], kind="stable")
+        tins = self.tin[np.asarray(joints_id, dtype=int)][ranks]
+        counts = np.searchsorted(tins, self.tout) - np.searchsorted(tins, self.tin)
+        return counts, tins, ranks
+
+    def decompose(self, joints_id: List[int]) -> np.array:
+        """
+            Split the chains from the roots to joints_id at their shared ancestors.
+
+            return np.array -> shape = (n_joints,), k if the joint only moves joints_id[k] (private chain of k), 
+                               -1 if it lies on several chains (shared), -2 if it lies on none of them
+        """
+        counts, tins, ranks = self.__chains_counts(joints_id=joints_id)
+        groups = np.where(counts > 1, -1, -2)
+        private = counts == 1
+        # the only joint of joints_id in a private subtree is the first one entered after the subtree root
+        groups[private] = ranks[np.searchsorted(tins, self.tin[private])]
+        return groups
+
+    def chains_mask(self, joints_id: List[int]) -> np.array:
+        """
+            Mask of the joints on the chains from the roots to joints_id
+        """
+        return self.__chains_counts(joints_id=joints_id)[0] > 0
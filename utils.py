@@ -40,4 +40,90 @@ def from_2_vec_to_quat(v1: np.array, v2: np.array) -> np.array:
         Get Quaterion rotating vector v1 into vector v2
     """ 
     q = np.concatenate((np.array([np.linalg.norm(v2)*np.linalg.norm(v1) + v2.dot(v1)]), np.cross(v2, v1)))
-    return q/np.linalg.norm(q)
\ No newline at end of file
+    return q/np.linalg.norm(q)
+
+def batch_axisangle_to_q(v: np.array, theta: np.array) -> np.array:
+    """
+        Batched version of axisangle_to_q
+
+        v: np.array -> shape = (M, 3)
+        theta: np.array -> shape = (M,)
+        return np.array -> shape = (M, 4)
+    """
+    v = v/np.linalg.norm(v, axis=-1, keepdims=True)
+    half_theta = np.asarray(theta)[..., None]/2.0
+    return np.concatenate((np.cos(half_theta), v*np.sin(half_theta)), axis=-1)
+
+
+def batch_from_2_vec_to_quat(v1: np.array, v2: np.array) -> np.array:
+    """
+        Batched version of from_2_vec_to_quat
+
+        v1, v2: np.array -> shape = (M, 3)
+        return np.array -> shape = (M, 4)
+    """
+    w = np.linalg.norm(v2, axis=-1)*np.linalg.norm(v1, axis=-1) + np.sum(v2*v1, axis=-1)
+    q = np.concatenate((w[..., None], np.cross(v2, v1)), axis=-1)
+    return q/np.linalg.norm(q, axis=-1, keepdims=True)
+
+
+def q_to_matrix(q: np.array) -> np.array:
+    """
+        Rotation matrix R such that R @ v == qv_mult(q, v)
+
+        q: np.array -> shape = (..., 4)
+        return np.array -> shape = (..., 3, 3)
+    """
+    if np.ndim(q) == 1:
+        w, x, y, z = q
+        return np.array([[1 - 2*(y*y + z*z), 2*(x*y + w*z), 2*(x*z - w*y)],
+                         [2*(x*y - w*z), 1 - 2*(x*x + z*z), 2*(y*z + w*x)],
+                         [2*(x*z + w*y), 2*(y*z - w*x), 1 - 2*(x*x + y*y)]], dtype=np.float64)
+    w, x, y, z = np.moveaxis(np.asarray(q, dtype=np.float64), -1, 0)
+    return np.stack((np.stack((1 - 2*(y*y + z*z), 2*(x*y + w*z), 2*(x*z - w*y)), axis=-1),
+                     np.stack((2*(x*y - w*z), 1 - 2*(x*x + z*z), 2*(y*z + w*x)), axis=-1),
+                     np.stack((2*(x*z + w*y), 2*(y*z - w*x), 1 - 2*(x*x + y*y)), axis=-1)), axis=-2)
+
+
+def matrix_to_q(m: np.array) -> np.array:
+    """
+        Inverse of q_to_matrix, the returned quaternion has non negative w
+
+        m: np.array -> shape = (..., 3, 3)
+        return np.array -> shape = (..., 4)
+    """
+    m = np.asarray(m, dtype=np.float64)
+    trace = m[..., 0, 0] + m[..., 1, 1] + m[..., 2, 2]
+    # one candidate per largest diagonal term, the best conditioned one is selected
+    candidates = np.stack((
+        np.stack((1 + trace, m[..., 1, 2] - m[..., 2, 1], m[..., 2, 0] - m[..., 0, 2], m[..., 0, 1] - m[..., 1, 0]), axis=-1),
+        np.stack((m[..., 1, 2] - m[..., 2, 1], 1 + 2*m[..., 0, 0] - trace, m[..., 0, 1] + m[..., 1, 0], m[..., 2, 0] + m[..., 0, 2]), axis=-1),
+        np.stack((m[..., 2, 0] - m[..., 0, 2], m[..., 0, 1] + m[..., 1, 0], 1 + 2*m[..., 1, 1] - trace, m[..., 1, 2] + m[..., 2, 1]), axis=-1),
+        np.stack((m[..., 0, 1] - m[..., 1, 0], m[..., 2, 0] + m[..., 0, 2], m[..., 1, 2] + m[..., 2, 1], 1 + 2*m[..., 2, 2] - trace), axis=-1)
+    ), axis=-2)
+    best = np.argmax(np.stack((trace, m[..., 0, 0], m[..., 1, 1], m[..., 2, 2]), axis=-1), axis=-1)
+    q = np.take_along_axis(candidates, best[..., None, None], axis=-2)[..., 0, :]
+    q = q/np.linalg.norm(q, axis=-1, keepdims=True)
+    return q*np.where(q[..., :1] < 0, -1.0, 1.0)
+
+
+def rotate_points(rotation: np.array, points: np.array, origin: np.array) -> np.array:
+    """
+        Rotate a block of points around origin
+
+        rotation: np.array -> shape = (3, 3)
+        points: np.array -> shape = (M, 3)
+        return np.array -> shape = (M, 3)
+    """
+    return (points - origin) @ rotation.T + origin
+
+
+def rotate_bases(rotation: np.array, bases: np.array) -> np.array:
+    """
+        Rotate every row (axis) of a block of basis
+
+        rotation: np.array -> shape = (3, 3)
+        bases: np.array -> shape = (M, 3, 3)
+        return np.array -> shape = (M, 3, 3)
+    """
+    return bases @ rotation.T
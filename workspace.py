@@ -0,0 +1,117 @@
+from __future__ import annotations
+import argparse
+import itertools
+import numpy as np
+from typing import List, Dict, Tuple, Optional, TYPE_CHECKING
+if TYPE_CHECKING:
+    from robot import Robot
+
+
+class WorkspaceMap:
+    def __init__(self, joints_id: List[int], voxel_size: float, voxels: np.array, angles: np.array,
+                 search_radius: int = 1) -> None:
+        """
+            Voxel occupancy of the locations reached by joints_id, with a representative pose for each voxel.
+            A set of joints is indexed by the centroid of their locations (same convention of SolutionCache).
+
+            voxels: np.array -> shape = (n_voxels, 3), integer coordinates of the occupied voxels
+            angles: np.array -> shape = (n_voxels, n_joints, 3), pose reaching each voxel (closest to its center)
+            search_radius: int - voxels around the target voxel searched by lookups, the sampling
+                                 is sparse and can leave holes close to the workspace boundary
+        """
+        self.joints_id = list(joints_id)
+        self.voxel_size = voxel_size
+        self.voxels = np.asarray(voxels, dtype=int)
+        self.angles = np.asarray(angles, dtype=np.float64)
+        self.search_radius = search_radius
+        self.offsets = np.array(list(itertools.product(range(-search_radius, search_radius+1), repeat=3)))
+        # offsets sorted by distance, lookups return the closest occupied voxel
+        self.offsets = self.offsets[np.argsort(np.sum(self.offsets**2, axis=1), kind="stable")]
+        self.index: Dict[Tuple[int, ...], int] = {tuple(v): i for i, v in enumerate(self.voxels.tolist())}
+
+    @classmethod
+    def build(cls, robot: Robot, joints_id: List[int], voxel_size: float = 1.0, n_samples: int = 100000,
+              seed: int = 0, batch_size: int = 4096, search_radius: int = 1) -> WorkspaceMap:
+        """
+            Sample the actuators angles within their constraints and run the forward kinematics in batches.
+
+            n_samples: int - poses sampled
+            batch_size: int - poses sent at once to Skeleton.batch_forward_kinematics
+        """
+        skeleton = robot.skeleton
+        rng = np.random.default_rng(seed)
+        voxels, angles, dists = [], [], []
+        for start in range(0, n_samples, batch_size):
+            samples = skeleton.sample_angles(n_samples=min(batch_size, n_samples - start), rng=rng)
+            locations, _ = skeleton.batch_forward_kinematics(angles=samples)
+            centroids = locations[:, joints_id].mean(axis=1)/voxel_size
+            voxels.append(np.floor(centroids).astype(int))
+            dists.append(np.sum((centroids - np.floor(centroids) - .5)**2, axis=1))
+            angles.append(samples)
+        voxels, angles, dists = np.concatenate(voxels), np.concatenate(angles), np.concatenate(dists)
+
+        # one pose for each voxel, the one closest to the voxel center
+        by_dist = np.argsort(dists, kind="stable")
+        _, first = np.unique(voxels[by_dist], axis=0, return_index=True)
+        kept = by_dist[first]
+        return cls(joints_id=joints_id, voxel_size=voxel_size, voxels=voxels[kept], angles=angles[kept],
+                   search_radius=search_radius)
+
+    def __voxel(self, target: np.array) -> np.array:
+        return np.floor(np.asarray(target, dtype=np.float64).reshape(-1, 3).mean(axis=0)/self.voxel_size).astype(int)
+
+    def __closest(self, target: np.array) -> Optional[int]:
+        voxel = self.__voxel(target=target)
+        for offset in self.offsets:
+            i = self.index.get(tuple((voxel + offset).tolist()))
+            if i is not None:
+                return i
+        return None
+
+    def is_reachable(self, target: np.array) -> bool:
+        """
+            False if no sampled pose brought joints_id within search_radius voxels of target
+        """
+        return self.__closest(target=target) is not None
+
+    def seed(self, target: np.array) -> Optional[np.array]:
+        """
+            Pose stored in the occupied voxel closest to target, None if target is unreachable
+
+            return np.array -> shape = (n_joints, 3), same layout of Skeleton.get_angles
+        """
+        i = self.__closest(target=target)
+        return None if i is None else self.angles[i].copy()
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.voxels.nbytes + self.angles.nbytes
+
+    def save(self, path: str) -> None:
+        np.savez(path, joints_id=np.array(self.joints_id, dtype=int), voxel_size=np.array(self.voxel_size),
+                 voxels=self.voxels, angles=self.angles, search_radius=np.array(self.search_radius))
+
+    @classmethod
+    def load(cls, path: str) -> WorkspaceMap:
+        data = np.load(path)
+        return cls(joints_id=data["joints_id"].tolist(), voxel_size=float(data["voxel_size"]), voxels=data["voxels"],
+                   angles=data["angles"], search_radius=int(data["search_radius"]))
+
+
+if __name__ == "__main__":
+    from config_parser import RobotConfigParser
+    parser = argparse.ArgumentParser(description="Precompute the workspace map of a set of joints")
+    parser.add_argument("config", help="configuration file")
+    parser.add_argument("output", help=".npz file written")
+    parser.add_argument("--joints-id", type=int, nargs="+", required=True)
+    parser.add_argument("--voxel-size", type=float, default=1.0)
+    parser.add_argument("--samples", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--search-radius", type=int, default=1)
+    args = parser.parse_args()
+
+    robot = RobotConfigParser(path=args.config).parse()
+    workspace = WorkspaceMap.build(robot=robot, joints_id=args.joints_id, voxel_size=args.voxel_size,
+                                   n_samples=args.samples, seed=args.seed, search_radius=args.search_radius)
+    workspace.save(path=args.output)
+    print(f"{len(workspace.voxels)} voxels, {workspace.memory_bytes} bytes")